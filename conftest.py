@@ -0,0 +1 @@
+# Makes the modules of the repository (settings, src, ssphlib) importable by the tests
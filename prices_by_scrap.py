@@ -1,23 +1,37 @@
-try:
-    import selenium as _
-except ImportError:
-    import sys
+import sys
 
-    print("Selenium not installed. Please install it:")
-    print(f"\tpip{str(ver) if (ver := sys.version_info.major) >= 3 else ''} install selenium")
-    sys.exit(1)
+import settings as global_settings
 
-import sys
+# The "query" command only reads the prices: it needs neither selenium nor numpy
+if global_settings.FETCHER == "selenium" and sys.argv[1:2] != ["query"]:  # The "http" fetcher does not need a browser
+    try:
+        import selenium as _
+    except ImportError:
+        print("Selenium not installed. Please install it:")
+        print(f"\tpip{str(ver) if (ver := sys.version_info.major) >= 3 else ''} install selenium")
+        sys.exit(1)
+
+if global_settings.AGGREGATION_ENGINE == "numpy" and sys.argv[1:2] != ["query"]:
+    try:
+        import numpy as _
+    except ImportError:
+        print("Numpy not installed. Please install it or use the \"python\" aggregation engine:")
+        print(f"\tpip{str(ver) if (ver := sys.version_info.major) >= 3 else ''} install numpy")
+        sys.exit(1)
+
+import os
 import datetime as dt
 from typing import List, Union
 
-from ssphlib.log import exit_error, LogLevels
+from ssphlib.log import exit_error, LogLevels, set_log_file
 
 from src.initialize import initialize
 from src.scrap import process_website
 from src.calculate import calculate
+from src.fingerprint import StageFingerprints
 from src.summary import summary
-import settings as global_settings
+from src.query import query
+from src.storage import export_csv, open_storage
 
 
 date = dt.datetime.now().strftime("%H:%m:%S.%f")
@@ -34,17 +48,22 @@ del date
 
 def scrap_help() -> None:
     print("Usage: ")
-    print(f"\t{global_settings.PYTHON_EXECUTABLE} prices_by_scrap.py [arguments]\n")
+    print(f"\t{global_settings.PYTHON_EXECUTABLE} prices_by_scrap.py [arguments]")
+    print(f"\t{global_settings.PYTHON_EXECUTABLE} prices_by_scrap.py query [arguments]\n")
     print(f"Example:")
     print(f"\t{global_settings.PYTHON_EXECUTABLE} prices_by_scrap.py -c Frankreich -c Deutschland -f result -s "
           f"2020-01-01 -l WARNING --no-summary\n")
     print(f"\tScrap the website for France (=Frankreich) and Germany (=Deutschland), save the result files in a folder"
           f"\n\tnamed \"result\", start on 1st of January 2020, show only warning and error messages and do not make a"
           f"\n\tsummary at the end.\n")
+    print(f"\t{global_settings.PYTHON_EXECUTABLE} prices_by_scrap.py query -c Frankreich -f result -s 2024-01-01 -e "
+          f"2024-01-07 --json\n")
+    print(f"\tWrite the prices of France from the 1st to the 7th of January 2024 in the folder \"result\" as JSON. "
+          f"Without -s,\n\tfrom the first price. Nothing is scrapped or calculated.\n")
     print(f"Warning: ")
     print(f"\tCountries names must be in Germain. Tags -s and -e include the date you gave. The output folder will be"
-          f"\n\tcreated. There could be duplicates in the prices result file if there is already the data. Changing"
-          f"\n\tthe date format may crash the program. Duplicating a tag in the arguments with overwrite the"
+          f"\n\tcreated. Rows already in the prices result file are not written again (revised values are replaced)."
+          f"\n\tChanging the date format may crash the program. Duplicating a tag in the arguments with overwrite the"
           f"\n\tprevious one except for -c.\n")
     print(f"Arguments:")
     print(f"\t-c [Country] -> Country to scrap. You must to specify at least one.")
@@ -56,7 +75,18 @@ def scrap_help() -> None:
     print(f"\t-l [Logging level (INFO, WARNING...) = INFO] -> Filter of log")
     print(f"\t-d [Date format = %Y-%m-%d (yyyy-mm-dd)] -> Date format everywhere")
     print(f"\t-m [Month date format = %Y-%m (yyyy-mm)] -> Date format to represent a month")
+    print(f"\t-o [Summary format = table] -> table, json, markdown or csv. Other formats are alone on the standard "
+          f"output")
+    print(f"\t-j [Jobs = 1] -> Number of web drivers scrapping days in parallel, and of processes calculating the "
+          f"averages from every price")
     print(f"\t--exit -> If a country does not exists in a page, exit the program (Default is False).")
+    print(f"\t--from-cache -> Extract the data from the saved snapshots instead of the website (Default is False).")
+    print(f"\t--refresh -> Scrap again the days already in the prices file to get revised values (Default is False).")
+    print(f"\t--export-csv -> Write the prices storage to the prices file (Default is False).")
+    print(f"\t--migrate -> Write the prices file to the prices storage (Default is False).")
+    print(f"\t--rebuild -> Calculate the averages from every price instead of the new ones (Default is False).")
+    print(f"\t--force -> Calculate even if the prices did not change since the last time (Default is False).")
+    print(f"\t--json -> Write the prices of the \"query\" command as JSON instead of CSV (Default is False).")
     print(f"\t--no-scrap -> Skip the scrapping of the website (Default is False).")
     print(f"\t--no-average -> Skip the calculating of the average (Default is False).")
     print(f"\t--no-summary -> Skip summary (Default is False).")
@@ -70,24 +100,62 @@ def main(argv: Union[List[str], str]) -> None:
     elif not isinstance(argv, list):
         exit_error(LogLevels.CRITICAL, "No arguments provided (or not str or list)", 2)
 
-    print("\t\x1b[4m\x1b[96m=> Initializing the program\x1b[0m")
+    if len(argv) > 0 and argv[0] == "query":  # Only the prices on the standard output, the logs on the standard error
+        argv = argv[1:] if "-l" in argv else [*argv[1:], "-l", "WARNING"]
+        set_log_file(sys.stderr)
+        settings = initialize(argv, read_only=True)
+        query(settings, settings["start_date"] if "-s" in argv else dt.date.min, settings["end_date"])
+        return
+
+    # Machine-readable summaries (-o) are alone on the standard output: the steps, the progress of the scrapping and
+    # the logs are written to the standard error
+    index = argv.index("-o") + 1 if "-o" in argv else len(argv)
+    steps = sys.stderr if index < len(argv) and argv[index] != "table" else sys.stdout
+    if steps is sys.stderr and "-l" not in argv:
+        argv = [*argv, "-l", "WARNING"]
+    global_settings.steps_file = steps
+    set_log_file(steps)
+
+    print("\t\x1b[4m\x1b[96m=> Initializing the program\x1b[0m", file=steps)
     settings = initialize(argv)
 
     if not settings["no_scrap"]:
-        if (settings["end_date"] - settings["start_date"]).days >= 0:
-            print("\t\x1b[4m\x1b[96m=> Scrapping website\x1b[0m")
+        if (settings["end_date"] - settings["start_date"]).days >= 0 or len(settings["retry_dates"]) > 0:
+            print("\t\x1b[4m\x1b[96m=> Scrapping website\x1b[0m", file=steps)
             process_website(settings)
         else:
             print("\x1b[91m\x1b[1m\x1b[3m\t=> No page to scrap (data is up to date or "
-                  "the end date happens before the start date)\x1b[0m")
-
-    if not settings["no_average"]:
-        print("\t\x1b[4m\x1b[96m=> Calculating average\x1b[0m")
-        calculate(settings)
+                  "the end date happens before the start date)\x1b[0m", file=steps)
+
+    if settings["export_csv"] and global_settings.PRICES_STORAGE != "csv":
+        storage = open_storage(settings["prices_output_file"], settings["date_format"])
+        export_csv(storage, settings["prices_output_file"])
+        storage.close()
+
+    # The calculation is skipped when its inputs did not change since it last ran: its outputs are still there, and
+    # the summary is made from its saved result
+    stages = StageFingerprints(settings)
+    fingerprint = stages.current()
+    outputs = [output for output in (settings["average_output_file"], settings["period_statistics_file"]) if output]
+    # --rebuild always calculates the aggregates again
+    run_calculate = not settings["no_average"] and (settings["rebuild"] or
+                                                    not stages.unchanged("calculate", fingerprint) or
+                                                    not all(os.path.exists(output) for output in outputs))
+    if not settings["no_summary"] and not settings["no_average"] and not os.path.exists(global_settings.cache_file):
+        run_calculate = True  # The summary needs the result of the calculation
+
+    result = None
+    if run_calculate:
+        print("\t\x1b[4m\x1b[96m=> Calculating average\x1b[0m", file=steps)
+        result = calculate(settings)
+        stages.done("calculate")
+    elif not settings["no_average"]:
+        print("\x1b[91m\x1b[1m\x1b[3m\t=> Average up to date (prices did not change, see --force)\x1b[0m",
+              file=steps)
 
     if not settings["no_summary"]:
-        print("\t\x1b[4m\x1b[96m=> Summary\x1b[0m")
-        summary(settings)
+        print("\t\x1b[4m\x1b[96m=> Summary\x1b[0m", file=steps)
+        summary(settings, result)
 
 
 if __name__ == "__main__":
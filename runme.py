@@ -10,4 +10,5 @@ ARGUMENTS = (
     "-e today"
 )
 
-prices_by_scrap([*ARGUMENTS.split(" "), *sys.argv[1:]])
+if __name__ == "__main__":  # The processes of -j import this module again
+    prices_by_scrap([*ARGUMENTS.split(" "), *sys.argv[1:]])
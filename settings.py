@@ -1,6 +1,6 @@
 import sys
 import datetime as dt
-from typing import Literal
+from typing import Dict, Literal, Optional, TextIO, Tuple, Union
 
 from ssphlib.log import LogLevels
 
@@ -11,18 +11,23 @@ from ssphlib.log import LogLevels
 PYTHON_EXECUTABLE = f"python{str(ver) if (ver := sys.version_info.major) >= 3 else ''}"
 URL = "https://www.regelleistung.net/apps/datacenter/tenders/" + \
       "?productTypes=PRL&markets=BALANCING_CAPACITY&date={date}&tenderTab=PRL$CAPACITY$1"
+# JSON backend of the website, used by the "http" fetcher. Can point to a local server serving recorded responses
+API_URL = "https://www.regelleistung.net/apps/datacenter/api/tenders/results" + \
+          "?productTypes=PRL&markets=BALANCING_CAPACITY&date={date}"
 TODAY = dt.date.today()
 # Tags
 TAGS_CORRESPONDENCE = {"-c": "countries", "-p": "prices_output_file", "-a": "average_output_file",
                        "-f": "output_folder", "-s": "start_date", "-e": "end_date", "-l": "log_level",
-                       "-d": "date_format", "-m": "month_date_format"}
+                       "-d": "date_format", "-m": "month_date_format", "-j": "jobs",
+                       "-o": "summary_format"}
 ADDITIVE_TAGS = ("-c",)
 FILE_TAGS = ("-p", "-a")
-CLASSIC_TAGS = ("-f",)
+CLASSIC_TAGS = ("-f", "-o")
+INT_TAGS = ("-j",)
 DATE_TAGS = ("-s", "-e")
 DATE_FORMAT_TAGS = ("-d", "-m")
 PREPROCESSED_TAGS = ("-l", *DATE_FORMAT_TAGS)
-ALL_TAGS = (*ADDITIVE_TAGS, *FILE_TAGS, *CLASSIC_TAGS, *DATE_TAGS, *PREPROCESSED_TAGS)
+ALL_TAGS = (*ADDITIVE_TAGS, *FILE_TAGS, *CLASSIC_TAGS, *INT_TAGS, *DATE_TAGS, *PREPROCESSED_TAGS)
 
 # Settings changeable by command line arguments (default values)
 DEFAULT_SETTINGS = {
@@ -35,10 +40,19 @@ DEFAULT_SETTINGS = {
     "log_level": LogLevels.INFO,
     "date_format": "%Y-%m-%d",
     "month_date_format": "%Y-%m",
+    "jobs": 1,
+    "summary_format": "table",
     "exit_if_error": False,
     "no_scrap": False,
     "no_average": False,
     "no_summary": False,
+    "from_cache": False,
+    "refresh": False,
+    "export_csv": False,
+    "migrate": False,
+    "rebuild": False,
+    "json": False,
+    "force": False,
 }
 
 # Settings
@@ -46,19 +60,127 @@ DEFAULT_SETTINGS = {
 CSV_SEP = ";"
 PRICES_CSV_HEAD = CSV_SEP.join(("Date", "Country", "Period", "Local marginal capacity price (euro/MW)"))
 AVERAGE_CSV_HEAD = CSV_SEP.join(("Country", "Month", "Mean of the LMCP per hour (euro/MW)", "Min", "Max"))
+PERIOD_STATISTICS_CSV_HEAD = CSV_SEP.join(("Country", "Month", "Period", "Mean of the LMCP (euro/MW)", "Min", "Max"))
 # Driver
 DRIVER_VERSION: str = "v0.34.0"
 DRIVER_NAME_FORMAT = "drivers/geckodriver-{version}-{platform}-{architecture}{extension}"
 PROCESSOR: Literal["x86", "x86-64", "arm64"] = "x86-64"
+# Long-lived WebDriver server (geckodriver, Selenium standalone or grid), for example "http://127.0.0.1:4444"
+# None starts a local Firefox for each run. Sessions are saved in SESSIONS_FILE (in the output folder) to be reused
+# by the next runs if KEEP_SESSIONS. A geckodriver server accepts one session only: use -j 1 with it
+WEBDRIVER_URL: Optional[str] = None
+KEEP_SESSIONS = True
+SESSIONS_FILE = "webdriver-sessions.json"
+# Browser profile
+HEADLESS = True
+# "eager" and "none" do not wait for the "load" event: only the table is waited for (see WAIT)
+PAGE_LOAD_STRATEGY: Literal["normal", "eager", "none"] = "eager"
+# Resources not downloaded by the browser (keys of BLOCK_PREFERENCES). The table does not need them
+BLOCK_RESOURCES: Tuple[str, ...] = ("image", "font", "media")
+BLOCK_PREFERENCES: Dict[str, Dict[str, Union[bool, int, str]]] = {
+    "image": {"permissions.default.image": 2},
+    "font": {"gfx.downloadable_fonts.enabled": False, "browser.display.use_document_fonts": 0},
+    "media": {"media.autoplay.default": 5, "media.preload.default": 0, "media.preload.auto": 0},
+    "stylesheet": {"permissions.default.stylesheet": 2},
+}
+# Other preferences of the browser: no prefetch, cache in memory only
+BROWSER_PREFERENCES: Dict[str, Union[bool, int, str]] = {
+    "network.prefetch-next": False,
+    "network.dns.disablePrefetch": True,
+    "network.http.speculative-parallel-limit": 0,
+    "browser.cache.disk.enable": False,
+    "browser.cache.memory.enable": True,
+    "browser.sessionhistory.max_entries": 1,
+}
+# Fetcher: "selenium" reads the website in Firefox, "http" reads the JSON backend (no browser)
+FETCHER: Literal["selenium", "http"] = "selenium"
+# Records in the JSON response of the backend: path to the list of records and keys of each record
+API_RECORDS_PATH: Tuple[str, ...] = ()
+API_COUNTRY_KEY = "country"
+API_PRODUCT_KEY = "product"
+API_PRICE_KEY = "price"
+# Snapshots: every fetched page is saved compressed in this folder (in the output folder), see --from-cache
+SAVE_SNAPSHOTS = True
+SNAPSHOTS_FOLDER = "snapshots"
+# Layout of the table: the xpath of the table found last is saved in this file (in the output folder) and tried first
+# If no known xpath matches, the table is the one with a header cell matching TABLE_HEADER_REGEX
+LAYOUT_FILE = "layout.json"
+TABLE_HEADER_REGEX = r"(NEG|POS)+_\d{2}_\d{2}"
+# Extraction: "script" reads the whole table in one round trip, "xpath" reads it cell by cell
+# "script" falls back to "xpath" if the script fails
+EXTRACTION: Literal["script", "xpath"] = "script"
+# Wait of the table: "observer" returns as soon as the table is rendered, "polling" tries every WAIT_TRIES
+# "observer" falls back to "polling" if the script fails
+WAIT: Literal["observer", "polling"] = "observer"
 # Timeouts
 TIMEOUT_TIME = 2
 WAIT_TRIES = 0.1
 MAX_TRIES = TIMEOUT_TIME / WAIT_TRIES
+# Upper bounds (seconds) of the buckets of the time per page histogram
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 5)
+# Storage of the prices: "csv" is the prices file, "columnar" is a folder of binary columns next to it, "sqlite" a
+# SQLite database next to it (prices file name without extension + extension) and "partitioned" a folder of CSV files
+# per country and month (prices file name without extension). "gzip" and "xz" are the prices file compressed (prices
+# file name + extension), one compressed member per batch. The storage is created from the prices file.
+# See --export-csv and --migrate
+PRICES_STORAGE: Literal["csv", "columnar", "sqlite", "partitioned", "gzip", "xz"] = "csv"
+COLUMNAR_EXTENSION = ".columns"
+SQLITE_EXTENSION = ".sqlite"
+GZIP_EXTENSION = ".gz"
+XZ_EXTENSION = ".xz"
+COMPRESSION_LEVEL = 6
+# Writing of the prices: rows are written by batches of WRITE_BATCH_SIZE rows or WRITE_BATCH_TIME seconds
+# "fsync" waits for each batch to be on the disk, "flush" only gives it to the system (faster, less safe)
+WRITE_BATCH_SIZE = 2048
+WRITE_BATCH_TIME = 5
+WRITE_DURABILITY: Literal["flush", "fsync"] = "fsync"
+# Index of the rows of the prices file (prices file name + extension): rows already in the file are not written
+# again. If SKIP_COMPLETE_DAYS, days with rows for every country are not scrapped (except with --refresh)
+KEY_INDEX_EXTENSION = ".keys"
+# Byte offsets of the rows of each country and day in the prices CSV file (prices file name + extension), updated after
+# the scrapping and used by the "query" command
+OFFSET_INDEX_EXTENSION = ".offsets"
+SKIP_COMPLETE_DAYS = True
+# Journal of the scrapping, next to the prices file (prices file name + extension)
+JOURNAL_EXTENSION = ".journal"
+# Newest date of each country in the prices storage (prices file name + extension), to find the start date without
+# reading the storage. Without it (or out of date), every row of the storage is read once: older days can be appended
+# after the newer ones
+WATERMARK_EXTENSION = ".watermark"
+# Bytes of the end of the prices storage hashed by the fingerprints of the stages (see FINGERPRINTS_FILE)
+TAIL_BLOCK_SIZE = 65536
+# Aggregates of each month, next to the prices file (prices file name + extension): only the new rows are added to
+# them by the calculation (all the rows with --rebuild)
+AGGREGATES_EXTENSION = ".aggregates"
+# Number of times the rows of the prices storage were rewritten (storage path + extension): the aggregates of another
+# generation are computed again
+GENERATION_EXTENSION = ".generation"
+# Calculation of the aggregates from every row: "numpy" groups the prices in arrays (numpy needed), "python" in dicts.
+# Both give the same averages
+AGGREGATION_ENGINE: Literal["python", "numpy"] = "python"
+# Extra statistics of the prices of the days of each month, added as columns of the average file: "median" or "pNN"
+# (NN-th percentile, e.g. "p10"). Calculated with quantile sketches of QUANTILE_SKETCH_SIZE values per month (exact
+# below this size). The sketches are kept with the aggregates of each month: only the new prices are added to them
+EXTRA_STATISTICS: Tuple[str, ...] = ()
+QUANTILE_SKETCH_SIZE = 200
+# Statistics of the prices of each period (column of the table) of each month, with EXTRA_STATISTICS, written to this
+# file in the output folder. Not written if None
+PERIOD_STATISTICS_FILE: Optional[str] = None
+# Fingerprint of the inputs of the calculation (file in the output folder): it is skipped when its inputs did not
+# change since it last ran (except with --force). The summary is always made, from the result of the last calculation
+FINGERPRINTS_FILE = "fingerprints.json"
+# Formats of the summary (-o): box tables for the terminal, or machine-readable outputs
+SUMMARY_FORMATS = ("table", "json", "markdown", "csv")
 # Others
 WEBSITE_DATE_FORMAT = "%Y-%m-%d"
 TODAY_TOKEN = "today"
 PRICE_DIVIDER = 24
 ROUND_VALUE = 2
-DELETE_CACHE = True
+# Remove the cache file (result of the last calculation) after a summary made from it: the next summary cannot skip
+# the calculation
+DELETE_CACHE = False
 
 cache_file: str = "cache.pkl"
+# Stream of the steps, the progress of the scrapping and the logs: the standard error when the summary is
+# machine-readable (-o)
+steps_file: TextIO = sys.stdout
@@ -0,0 +1,220 @@
+import datetime as dt
+import os
+from pickle import dump, load, UnpicklingError
+from typing import Dict, List, Optional, Set, Tuple
+
+from ssphlib.log import log, LogLevels
+
+from src.extra_statistics import add_period, day_statistics, MonthStatistics, PeriodStatistics
+from src.parallel import daily_sums, period_statistics
+from src.storage import PricesStorage, parse_date
+from src.vectorized import monthly_aggregates
+import settings as global_settings
+
+AGGREGATES_VERSION = 3
+
+
+class Rebuild(Exception):
+    """
+    The aggregates cannot be updated with the new rows: they are computed again from the whole storage
+    """
+    pass
+
+
+class MonthlyAggregates:
+    """
+    Aggregates of the daily prices of each country and month, kept between the runs in a sidecar file (prices file
+    name + extension): sum, count, min and max of the days of each closed month and the total of each day of the newest
+    month of each country (still open). With the extra statistics, the statistics of the days of each closed month and
+    of the prices of each period of each month are kept too (quantile sketches of constant size). Only the rows
+    appended to the storage since the last run are added. The aggregates are computed again from the whole storage if
+    the storage was rewritten (revised or duplicated rows, see PricesStorage.generation), the parameters changed or
+    rows were added to a closed month
+    """
+    __slots__ = ["storage", "path", "parameters", "size", "months", "days", "statistics", "periods", "changed"]
+
+    def __init__(self, storage: PricesStorage, prices_file: str, countries: Set[str], month_date_format: str,
+                 statistics: bool = False, periods: bool = False) -> None:
+        """
+        :param statistics: Whether the statistics of the days of each month are kept (EXTRA_STATISTICS)
+        :param periods: Whether the statistics of each period of each month are kept (PERIOD_STATISTICS_FILE)
+        """
+        self.storage = storage
+        self.path = prices_file + global_settings.AGGREGATES_EXTENSION
+        self.parameters = (AGGREGATES_VERSION, storage.kind, tuple(sorted(countries)), month_date_format,
+                           global_settings.PRICE_DIVIDER, statistics, periods,
+                           global_settings.QUANTILE_SKETCH_SIZE)
+        self.size = 0
+        # Closed months: [sum, count, min, max] of the prices of the days. The open month is None
+        self.months: Dict[str, Dict[str, Optional[List[float]]]] = {}
+        # Total of each day of the open month
+        self.days: Dict[str, Dict[dt.date, float]] = {}
+        # Statistics of the days of each closed month and of each period of each month (all the months)
+        self.statistics: MonthStatistics = {}
+        self.periods: PeriodStatistics = {}
+        self.changed: Set[Tuple[str, str]] = set()  # (country, month) changed by this run
+
+    @property
+    def countries(self) -> Set[str]:
+        return set(self.parameters[2])
+
+    @property
+    def keeps_month_statistics(self) -> bool:
+        return self.parameters[5]
+
+    @property
+    def keeps_period_statistics(self) -> bool:
+        return self.parameters[6]
+
+    def month(self, day: dt.date) -> str:
+        return day.strftime(self.parameters[3])
+
+    def load(self) -> bool:
+        """
+        :return: Whether the saved aggregates can be updated with the storage
+        """
+        if self.storage.upserts or not os.path.exists(self.path):
+            return False
+        try:
+            with open(self.path, "rb") as f:
+                parameters, generation, size, months, days, statistics, periods = load(f)
+        except (OSError, EOFError, ValueError, TypeError, UnpicklingError):
+            return False
+        # Rows are only appended between two rewrites: the aggregates are still valid up to their size
+        if parameters != self.parameters or generation != self.storage.generation() or \
+                not self.storage.is_boundary(size):
+            return False
+        self.size, self.months, self.days, self.statistics, self.periods = size, months, days, statistics, periods
+        return True
+
+    def update(self, rebuild: bool = False, jobs: int = 1) -> None:
+        if not rebuild and self.load():
+            if self.size == self.storage.size():
+                return
+            try:
+                self.add_rows(self.size)
+                self.size = self.storage.size()
+                return
+            except Rebuild:
+                pass
+        log(LogLevels.INFO, f"Calculating the monthly aggregates of {self.storage.path!r} from every row")
+        self.size = self.storage.size()
+        # The statistics of the closed months need the total of each of their days: not given by the numpy engine
+        if global_settings.AGGREGATION_ENGINE == "numpy" and not self.keeps_month_statistics:
+            self.months, self.days = monthly_aggregates(self.storage, self.countries, self.month)
+            self.statistics = {}
+            self.changed = {(country, month) for country, months in self.months.items() for month in months}
+        else:
+            self.rebuild(daily_sums(self.storage, self.countries, jobs))
+        self.periods = period_statistics(self.storage, self.countries, self.parameters[3], jobs) \
+            if self.keeps_period_statistics else {}
+
+    def rebuild(self, data_day: Dict[str, Dict[dt.date, float]]) -> None:
+        # Days can be in any order (retried days): the newest month of each country is the open one
+        self.months, self.days, self.statistics, self.changed = {}, {}, {}, set()
+        for country, days in data_day.items():
+            grouped: Dict[str, List[dt.date]] = {}
+            for day in days:
+                grouped.setdefault(self.month(day), []).append(day)
+            open_month = self.month(max(days))
+            self.months[country] = {
+                month: None if month == open_month else self.aggregate(days[day] for day in month_days)
+                for month, month_days in grouped.items()}
+            self.days[country] = {day: days[day] for day in grouped[open_month]}
+            if self.keeps_month_statistics:
+                self.statistics[country] = {month: day_statistics(days[day] for day in month_days)
+                                            for month, month_days in grouped.items() if month != open_month}
+            self.changed.update((country, month) for month in grouped)
+
+    def add_rows(self, start: int) -> None:
+        countries = self.countries
+        dates: Dict[str, dt.date] = {}
+        for date, country, period, value in self.storage.read(start):
+            if country not in countries:
+                continue
+            if date not in dates:
+                try:
+                    dates[date] = parse_date(date, self.storage.date_format)
+                except ValueError:
+                    continue
+            self.add(country, dates[date], float(value))
+            if self.keeps_period_statistics:
+                add_period(self.periods, country, self.month(dates[date]), period, float(value))
+
+    def add(self, country: str, day: dt.date, value: float) -> None:
+        """
+        Add a price (or the total of a day) to its day
+        """
+        months = self.months.setdefault(country, {})
+        days = self.days.setdefault(country, {})
+        month = self.month(day)
+        self.changed.add((country, month))
+        if month not in months:
+            if len(days) > 0 and (day.year, day.month) < max((open_day.year, open_day.month) for open_day in days):
+                raise Rebuild()
+            # A newer month: the open month is closed
+            for open_month in months:
+                if months[open_month] is None:
+                    months[open_month] = self.aggregate(days.values())
+                    if self.keeps_month_statistics:
+                        self.statistics.setdefault(country, {})[open_month] = day_statistics(days.values())
+            days.clear()
+            months[month] = None
+        elif months[month] is not None:
+            raise Rebuild()
+        days.setdefault(day, 0)
+        days[day] += value
+
+    @staticmethod
+    def aggregate(totals) -> List[float]:
+        values = [total / global_settings.PRICE_DIVIDER for total in totals]
+        return [sum(values), len(values), min(values), max(values)]
+
+    def averages(self) -> Dict[str, Dict[str, Tuple[float, float, float]]]:
+        """
+        :return: The mean, min and max of each month, for each country
+        """
+        result: Dict[str, Dict[str, Tuple[float, float, float]]] = {}
+        for country, months in self.months.items():
+            result.setdefault(country, {})
+            for month, aggregate in months.items():
+                value_sum, count, value_min, value_max = aggregate or self.aggregate(self.days[country].values())
+                result[country][month] = (
+                    round(value_sum / count, global_settings.ROUND_VALUE),
+                    round(value_min, global_settings.ROUND_VALUE),
+                    round(value_max, global_settings.ROUND_VALUE)
+                )
+        return result
+
+    def month_statistics(self) -> MonthStatistics:
+        """
+        :return: The statistics of the days of each month (kept for the closed months), for each country
+        """
+        result: MonthStatistics = {}
+        for country, months in self.months.items():
+            result[country] = {month: day_statistics(self.days[country].values()) if aggregate is None
+                               else self.statistics[country][month] for month, aggregate in months.items()}
+        return result
+
+    def current_month(self, date_format: str) -> Dict[str, Dict[str, str]]:
+        """
+        :return: The price of each day of the current month, for each country
+        """
+        data_current_month: Dict[str, Dict[str, str]] = {}
+        td = global_settings.TODAY
+        for country, days in self.days.items():
+            data_current_month.setdefault(country, {})
+            for day, value in days.items():
+                if day.year != td.year or day.month != td.month:
+                    continue
+                value = value / global_settings.PRICE_DIVIDER
+                data_current_month[country][day.strftime(date_format)] = str(round(value, global_settings.ROUND_VALUE))
+        return data_current_month
+
+    def save(self) -> None:
+        if self.storage.upserts:
+            return
+        with open(self.path + ".tmp", "wb") as f:
+            dump((self.parameters, self.storage.generation(), self.size, self.months, self.days, self.statistics,
+                  self.periods), f)
+        os.replace(self.path + ".tmp", self.path)
@@ -1,89 +1,63 @@
-import datetime as dt
-from pickle import dump
 from time import time
-from typing import Any, Dict, List, Tuple
+from typing import Any, Dict
 
 from ssphlib.log import log, LogLevels
 from ssphlib.utilities import decompose
 
-from src.initialize import date_strptime
+from src.aggregates import MonthlyAggregates
+from src.extra_statistics import statistics_head
+from src.result import CalculationResult
+from src.storage import open_storage
 import settings as global_settings
 
 
-def calculate(settings: Dict[str, Any]):
+def calculate(settings: Dict[str, Any]) -> CalculationResult:
 
     start_calculate_time = time()
-    _head = None
+    storage = open_storage(settings["prices_output_file"], settings["date_format"])
 
-    def get_lines():
-        nonlocal _head
+    # Add the new rows to the aggregates and statistics of each month (all the rows with --rebuild, with -j processes)
+    extra = global_settings.EXTRA_STATISTICS
+    aggregates = MonthlyAggregates(storage, settings["prices_output_file"], settings["countries"],
+                                   settings["month_date_format"], len(extra) > 0,
+                                   settings["period_statistics_file"] is not None)
+    aggregates.update(rebuild=settings["rebuild"], jobs=settings["jobs"])
+    aggregates.save()
+    log(LogLevels.DEBUG, f"{len(aggregates.changed)} month(s) changed since the last calculation")
 
-        with open(settings["prices_output_file"], "r") as in_file:
-            _head = in_file.readline()
-            line = in_file.readline()
-            while line != "":
-                yield line.strip().split(global_settings.CSV_SEP)
-                line = in_file.readline()
+    result = CalculationResult(aggregates.averages(), aggregates.current_month(settings["date_format"]))
 
-    def get_month(date_: dt.date) -> str:
-        return date_.strftime(settings["month_date_format"])
+    # Extra statistics of each month (quantiles of the days)
+    month_statistics = aggregates.month_statistics() if len(extra) > 0 else {}
 
-    # Calculate the price for a day for each country (sum)
-    data_day: Dict[str, Dict[dt.date, float]] = {}
-    for date, country, _, value in get_lines():
-        if country not in settings["countries"]:
-            continue
-        date = date_strptime(date, settings["date_format"])
+    storage.save_averages(result.averages)
+    storage.close()
 
-        data_day.setdefault(country, {})
-        data_day[country].setdefault(date, 0)
-        data_day[country][date] += float(value)
-
-    # Get the current month
-    data_current_month: Dict[str, Dict[str, str]] = {}
-    td = global_settings.TODAY
-    for country, days in data_day.items():
-        data_current_month.setdefault(country, {})
-        for day, value in days.items():
-            if day.year != td.year or day.month != td.month:
-                continue
-            value = value / global_settings.PRICE_DIVIDER
-            data_current_month[country][day.strftime(settings["date_format"])] = \
-                str(round(value, global_settings.ROUND_VALUE))
-
-    # Sort by month
-    data_month: Dict[str, Dict[str, List[float]]] = {}
-    for country, days in data_day.items():
-        data_month.setdefault(country, {})
-        for day, value in days.items():
-            month = get_month(day)
-            data_month[country].setdefault(month, [])
-            data_month[country][month].append(value / global_settings.PRICE_DIVIDER)
-
-    # Mean of the month
-    result: Dict[str, Dict[str, Tuple[float, float, float]]] = {}
-    for country, months in data_month.items():
-        result.setdefault(country, {})
-        for month, values in months.items():
-            result[country][month] = (
-                round(sum(values) / len(values), global_settings.ROUND_VALUE),
-                round(min(values), global_settings.ROUND_VALUE),
-                round(max(values), global_settings.ROUND_VALUE)
-            )
-
-    with open(global_settings.cache_file, "wb") as f:
-        dump((result, data_current_month), f)
+    # Kept for the summaries of the next runs without calculation (skipped or --no-average)
+    result.save(global_settings.cache_file)
 
     # Save the result
     with open(settings["average_output_file"], "w") as f:
-        f.write(global_settings.AVERAGE_CSV_HEAD)
-        for country, months in result.items():
+        f.write(global_settings.CSV_SEP.join((global_settings.AVERAGE_CSV_HEAD, *statistics_head(extra))))
+        for country, months in result.averages.items():
             for month, (value_mean, value_min, value_max) in months.items():
                 line_data = (country, month, str(value_mean), str(value_min), str(value_max))
+                if len(extra) > 0:
+                    line_data += tuple(map(str, month_statistics[country][month].quantiles(extra)))
                 f.write("\n" + global_settings.CSV_SEP.join(line_data))
 
+    if settings["period_statistics_file"] is not None:
+        with open(settings["period_statistics_file"], "w") as f:
+            f.write(global_settings.CSV_SEP.join((global_settings.PERIOD_STATISTICS_CSV_HEAD, *statistics_head(extra))))
+            for country, months in aggregates.periods.items():
+                for month, periods in months.items():
+                    for period, statistics in periods.items():
+                        line_data = (country, month, period, *map(str, statistics.values(extra)))
+                        f.write("\n" + global_settings.CSV_SEP.join(line_data))
+
     end_calculate_time = time()
     time_took = round((end_calculate_time - start_calculate_time) * 1000000)
     seconds, miliseconds, microseconds = decompose(time_took, (1000000, 1000))
     log(LogLevels.INFO,
         f"Calculating took {seconds} seconds, {miliseconds} miliseconds and {microseconds} microseconds.")
+    return result
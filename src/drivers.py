@@ -0,0 +1,127 @@
+import json
+import os
+import threading
+from typing import List, Optional
+
+from selenium import webdriver, common
+from ssphlib.log import log, LogLevels
+
+import settings as global_settings
+
+
+def browser_options() -> webdriver.FirefoxOptions:
+    # Lean profile: no window, no useless downloads and get() returns before the full "load" event
+    options = webdriver.FirefoxOptions()
+    if global_settings.HEADLESS:
+        options.add_argument("-headless")
+    options.page_load_strategy = global_settings.PAGE_LOAD_STRATEGY
+    for resource in global_settings.BLOCK_RESOURCES:
+        for name, value in global_settings.BLOCK_PREFERENCES[resource].items():
+            options.set_preference(name, value)
+    for name, value in global_settings.BROWSER_PREFERENCES.items():
+        options.set_preference(name, value)
+    return options
+
+
+def new_driver(driver_path: str) -> Optional[webdriver.Firefox]:
+    try:
+        # noinspection PyUnresolvedReferences
+        return webdriver.Firefox(
+            service=webdriver.firefox.service.Service(driver_path),
+            options=browser_options()
+        )
+    except common.exceptions.WebDriverException as exc:
+        log(LogLevels.CRITICAL, "Webdriver can't be initialized. \nIf you don't have Firefox, "
+                                "please install it (https://www.mozilla.org/en-US/firefox/new/).")
+        log(LogLevels.CRITICAL, f"{type(exc).__name__}: {str(exc)}")
+        return None
+
+
+class AttachedRemote(webdriver.Remote):
+    """
+    Remote driver using an existing session of the server instead of creating a new one
+    """
+
+    def __init__(self, command_executor: str, session_id: str) -> None:
+        self.attached_session_id = session_id
+        super().__init__(command_executor=command_executor, options=browser_options())
+
+    def start_session(self, *args, **kwargs) -> None:
+        self.session_id = self.attached_session_id
+        self.caps = {}
+
+
+def new_remote_driver(url: str) -> Optional[webdriver.Remote]:
+    try:
+        return webdriver.Remote(command_executor=url, options=browser_options())
+    except Exception as exc:  # Connection errors are not all WebDriverException
+        log(LogLevels.CRITICAL, f"Cannot create a session on the WebDriver server {url!r}.")
+        log(LogLevels.CRITICAL, f"{type(exc).__name__}: {str(exc)}")
+        return None
+
+
+def attach_remote_driver(url: str, session_id: str) -> Optional[webdriver.Remote]:
+    try:
+        wd = AttachedRemote(url, session_id)
+        _ = wd.current_url  # Fails if the session is over
+    except Exception as exc:  # Connection errors are not all WebDriverException
+        log(LogLevels.DEBUG, f"Session {session_id} cannot be used ({type(exc).__name__})")
+        return None
+    return wd
+
+
+class DriverFactory:
+    """
+    Gives a web driver to each fetcher. Without WEBDRIVER_URL, it starts a local Firefox. With it, it uses sessions
+    of a long-lived WebDriver server (geckodriver, Selenium standalone or grid): the sessions left by the previous
+    runs are reused (warm browsers), and the sessions are kept for the next runs (KEEP_SESSIONS)
+    """
+    __slots__ = ["driver_path", "remote_url", "sessions_file", "lock"]
+
+    def __init__(self, driver_path: str, remote_url: Optional[str], sessions_file: str) -> None:
+        self.driver_path = driver_path
+        self.remote_url = remote_url
+        self.sessions_file = sessions_file
+        self.lock = threading.Lock()
+
+    def load_sessions(self) -> List[str]:
+        if not os.path.exists(self.sessions_file):
+            return []
+        try:
+            with open(self.sessions_file, "r") as f:
+                saved = json.load(f)
+        except ValueError:
+            return []
+        return list(saved["sessions"]) if saved.get("url") == self.remote_url else []
+
+    def save_sessions(self, sessions: List[str]) -> None:
+        with open(self.sessions_file + ".tmp", "w") as f:
+            json.dump({"url": self.remote_url, "sessions": sessions}, f)
+        os.replace(self.sessions_file + ".tmp", self.sessions_file)
+
+    def acquire(self) -> Optional[webdriver.Remote]:
+        if self.remote_url is None:
+            return new_driver(self.driver_path)
+
+        # A session taken is removed from the file: another run cannot use it at the same time
+        while True:
+            with self.lock:
+                sessions = self.load_sessions()
+                if len(sessions) == 0:
+                    break
+                session_id = sessions.pop(0)
+                self.save_sessions(sessions)
+            wd = attach_remote_driver(self.remote_url, session_id)
+            if wd is not None:
+                log(LogLevels.DEBUG, f"Reusing session {session_id}")
+                return wd
+        return new_remote_driver(self.remote_url)
+
+    def release(self, wd: webdriver.Remote) -> None:
+        if self.remote_url is None:
+            wd.close()
+        elif global_settings.KEEP_SESSIONS:
+            with self.lock:
+                self.save_sessions([*self.load_sessions(), wd.session_id])
+        else:
+            wd.quit()
@@ -0,0 +1,167 @@
+import datetime as dt
+import re
+from math import ceil
+from typing import Callable, Dict, Iterable, List, Optional
+
+from src.storage import Record
+import settings as global_settings
+
+STATISTIC_REGEX = r"median|p(\d{1,2})"
+
+
+def quantile_of(name: str) -> Optional[float]:
+    """
+    :return: The quantile of an extra statistic ("median" or "pNN"), None if unknown
+    """
+    match = re.fullmatch(STATISTIC_REGEX, name)
+    if match is None:
+        return None
+    return 0.5 if name == "median" else int(match.group(1)) / 100
+
+
+def statistics_head(names: Iterable[str]) -> List[str]:
+    return [name.capitalize() for name in names]
+
+
+class QuantileSketch:
+    """
+    Mergeable quantile sketch (KLL) of constant size: the values are kept in levels, a value of the level h standing
+    for 2 ** h values. A full level is sorted and one value out of two goes up to the next level (the even and the odd
+    ones in turn). Exact while fewer than `size` values were added
+    """
+    __slots__ = ["size", "levels", "count", "odd"]
+
+    def __init__(self, size: int) -> None:
+        self.size = size
+        self.levels: List[List[float]] = [[]]
+        self.count = 0
+        self.odd = False
+
+    def capacity(self, level: int) -> int:
+        # Lower levels are smaller
+        return max(2, int(self.size * (2 / 3) ** (len(self.levels) - 1 - level)))
+
+    def add(self, value: float) -> None:
+        self.levels[0].append(value)
+        self.count += 1
+        if len(self.levels[0]) >= self.capacity(0):
+            self.compact()
+
+    def merge(self, other: "QuantileSketch") -> None:
+        for level, values in enumerate(other.levels):
+            if level == len(self.levels):
+                self.levels.append([])
+            self.levels[level].extend(values)
+        self.count += other.count
+        self.compact()
+
+    def compact(self) -> None:
+        level = 0
+        while level < len(self.levels):
+            if len(self.levels[level]) >= self.capacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append([])
+                values = sorted(self.levels[level])
+                kept = [values.pop()] if len(values) % 2 == 1 else []
+                self.levels[level + 1].extend(values[self.odd::2])
+                self.levels[level] = kept
+                self.odd = not self.odd
+            level += 1
+
+    def quantile(self, quantile: float) -> float:
+        """
+        :return: The value of this rank (nearest rank: the smallest value with at least `quantile` of the values below
+            or equal)
+        """
+        weighted = sorted((value, 1 << level) for level, values in enumerate(self.levels) for value in values)
+        rank = max(1, ceil(quantile * self.count))
+        below = 0
+        for value, weight in weighted:
+            below += weight
+            if below >= rank:
+                return value
+        return weighted[-1][0]
+
+
+class Statistics:
+    """
+    Mean, min, max and quantiles of a group of values, in constant memory
+    """
+    __slots__ = ["sum", "count", "min", "max", "sketch"]
+
+    def __init__(self) -> None:
+        self.sum = 0.0
+        self.count = 0
+        self.min = float("inf")
+        self.max = float("-inf")
+        self.sketch = QuantileSketch(global_settings.QUANTILE_SKETCH_SIZE)
+
+    def add(self, value: float) -> None:
+        self.sum += value
+        self.count += 1
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        self.sketch.add(value)
+
+    def merge(self, other: "Statistics") -> None:
+        self.sum += other.sum
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.sketch.merge(other.sketch)
+
+    def quantiles(self, names: Iterable[str]) -> List[float]:
+        return [round(self.sketch.quantile(quantile_of(name)), global_settings.ROUND_VALUE) for name in names]
+
+    def values(self, names: Iterable[str]) -> List[float]:
+        """
+        :return: Mean, min, max and the extra statistics `names`, rounded
+        """
+        return [round(self.sum / self.count, global_settings.ROUND_VALUE), round(self.min, global_settings.ROUND_VALUE),
+                round(self.max, global_settings.ROUND_VALUE), *self.quantiles(names)]
+
+
+# Statistics of each month of each country, and of each period of each month of each country
+MonthStatistics = Dict[str, Dict[str, Statistics]]
+PeriodStatistics = Dict[str, Dict[str, Dict[str, Statistics]]]
+
+
+def day_statistics(totals: Iterable[float]) -> Statistics:
+    """
+    Statistics of the prices of the days of a month (total of the day / PRICE_DIVIDER, like the averages)
+    """
+    statistics = Statistics()
+    for total in totals:
+        statistics.add(total / global_settings.PRICE_DIVIDER)
+    return statistics
+
+
+def add_period(period_statistics: PeriodStatistics, country: str, month: str, period: str, value: float) -> None:
+    period_statistics.setdefault(country, {}).setdefault(month, {}).setdefault(period, Statistics()).add(value)
+
+
+def merge_periods(period_statistics: PeriodStatistics, other: PeriodStatistics) -> None:
+    """
+    Add the statistics of `other` (other rows of the storage) to `period_statistics`
+    """
+    for country, months in other.items():
+        for month, periods in months.items():
+            for period, statistics in periods.items():
+                kept = period_statistics.setdefault(country, {}).setdefault(month, {})
+                if period in kept:
+                    kept[period].merge(statistics)
+                else:
+                    kept[period] = statistics
+
+
+def record_periods(records: Iterable[Record], month: Callable[[dt.date], str]) -> PeriodStatistics:
+    """
+    Statistics of the prices of each period of each month, for each country
+    """
+    period_statistics: PeriodStatistics = {}
+    months: Dict[dt.date, str] = {}
+    for date, country, period, value in records:
+        if date not in months:
+            months[date] = month(date)
+        add_period(period_statistics, country, months[date], period, value)
+    return period_statistics
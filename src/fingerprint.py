@@ -0,0 +1,68 @@
+import hashlib
+import json
+import os
+from typing import Any, Dict, List
+
+from src.storage import open_storage
+import settings as global_settings
+
+
+def path_fingerprint(path: str) -> List[Any]:
+    """
+    :return: Size, modification time and hash of the end of each file of the path (file or folder)
+    """
+    if os.path.isdir(path):
+        return [[os.path.relpath(os.path.join(folder, name), path), *path_fingerprint(os.path.join(folder, name))]
+                for folder, _, names in sorted(os.walk(path)) for name in sorted(names)]
+    if not os.path.exists(path):
+        return []
+    stat = os.stat(path)
+    with open(path, "rb") as f:
+        f.seek(max(0, stat.st_size - global_settings.TAIL_BLOCK_SIZE))
+        tail_hash = hashlib.sha1(f.read()).hexdigest()
+    return [stat.st_size, stat.st_mtime_ns, tail_hash]
+
+
+class StageFingerprints:
+    """
+    Fingerprint of the inputs of the calculation: the prices storage, the countries, the formats and the settings
+    changing the outputs. Saved in a file of the output folder after each stage: a stage is skipped when its inputs
+    did not change since it last ran (except with --force)
+    """
+    __slots__ = ["settings", "path", "stages"]
+
+    def __init__(self, settings: Dict[str, Any]) -> None:
+        self.settings = settings
+        self.path = settings["fingerprints_file"]
+        self.stages: Dict[str, str] = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r") as f:
+                    self.stages = json.load(f)
+            except (OSError, ValueError):
+                self.stages = {}
+        # The summaries were stages of the older versions: they are always made now
+        self.stages = {stage: fingerprint for stage, fingerprint in self.stages.items()
+                       if not stage.startswith("summary:")}
+
+    def current(self) -> str:
+        storage = open_storage(self.settings["prices_output_file"], self.settings["date_format"])
+        storage_path = storage.path
+        storage.close()
+        inputs = [
+            global_settings.PRICES_STORAGE, path_fingerprint(storage_path), path_fingerprint(storage_path + "-wal"),
+            sorted(self.settings["countries"]), self.settings["date_format"], self.settings["month_date_format"],
+            self.settings["average_output_file"], self.settings["period_statistics_file"],
+            global_settings.TODAY.strftime("%Y-%m"), global_settings.PRICE_DIVIDER, global_settings.ROUND_VALUE,
+            list(global_settings.EXTRA_STATISTICS)
+        ]
+        return hashlib.sha1(json.dumps(inputs).encode("utf-8")).hexdigest()
+
+    def unchanged(self, stage: str, fingerprint: str) -> bool:
+        return not self.settings["force"] and self.stages.get(stage) == fingerprint
+
+    def done(self, stage: str) -> None:
+        self.stages[stage] = self.current()
+        with open(self.path + ".tmp", "w") as f:
+            json.dump(self.stages, f)
+        os.replace(self.path + ".tmp", self.path)
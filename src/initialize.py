@@ -5,6 +5,11 @@ import datetime as dt
 from typing import Any, Callable, Dict, Union
 
 from ssphlib.log import log, exit_error, exit_if, LogLevels, set_log_format
+
+from src.extra_statistics import quantile_of
+from src.journal import ScrapJournal
+from src.storage import import_csv, open_storage, storage_path
+from src.watermark import Watermark
 import settings as global_settings
 
 argv: str
@@ -53,6 +58,20 @@ class ArgsParser:
                 exit_error(LogLevels.ERROR, f"Date {next_argument!r} ({name.replace('_', ' ')}) doesn't match "
                                             f"format {settings['date_format']!r}", 5)
 
+    @classmethod
+    def integer(cls, name: str):
+        if next_argument is None:
+            log(LogLevels.WARNING, f"Nothing after tag \"{argument}\". Ignoring. Default is {settings[name]}")
+            return
+        try:
+            value = int(next_argument)
+        except ValueError:
+            value = 0
+        if value < 1:
+            exit_error(LogLevels.ERROR, f"Value {next_argument!r} ({name.replace('_', ' ')}) is not a positive "
+                                        f"integer", 5)
+        settings[name] = value
+
 
 class InitializeSteps:
     __slots__ = []
@@ -106,10 +125,26 @@ class InitializeSteps:
                                    lambda var: os.path.expandvars(os.path.expanduser(var)))
             elif argument in global_settings.CLASSIC_TAGS:
                 ArgsParser.classic(global_settings.TAGS_CORRESPONDENCE[argument])
+            elif argument in global_settings.INT_TAGS:
+                ArgsParser.integer(global_settings.TAGS_CORRESPONDENCE[argument])
             elif argument in global_settings.DATE_TAGS:
                 ArgsParser.date(global_settings.TAGS_CORRESPONDENCE[argument])
             elif argument == "--exit":
                 settings["exit_if_error"] = True
+            elif argument == "--from-cache":
+                settings["from_cache"] = True
+            elif argument == "--refresh":
+                settings["refresh"] = True
+            elif argument == "--export-csv":
+                settings["export_csv"] = True
+            elif argument == "--migrate":
+                settings["migrate"] = True
+            elif argument == "--rebuild":
+                settings["rebuild"] = True
+            elif argument == "--json":
+                settings["json"] = True
+            elif argument == "--force":
+                settings["force"] = True
             elif argument.startswith("--no-"):
                 settings[f"no_{argument[len('--no-'):]}"] = True
             elif argument not in global_settings.ALL_TAGS:
@@ -122,7 +157,14 @@ class InitializeSteps:
         # Update result_file
         settings["prices_output_file"] = os.path.join(settings["output_folder"], settings["prices_output_file"])
         settings["average_output_file"] = os.path.join(settings["output_folder"], settings["average_output_file"])
+        settings["journal_file"] = settings["prices_output_file"] + global_settings.JOURNAL_EXTENSION
         global_settings.cache_file = os.path.join(settings["output_folder"], global_settings.cache_file)
+        settings["snapshots_folder"] = os.path.join(settings["output_folder"], global_settings.SNAPSHOTS_FOLDER)
+        settings["sessions_file"] = os.path.join(settings["output_folder"], global_settings.SESSIONS_FILE)
+        settings["layout_file"] = os.path.join(settings["output_folder"], global_settings.LAYOUT_FILE)
+        settings["fingerprints_file"] = os.path.join(settings["output_folder"], global_settings.FINGERPRINTS_FILE)
+        settings["period_statistics_file"] = None if global_settings.PERIOD_STATISTICS_FILE is None else \
+            os.path.join(settings["output_folder"], global_settings.PERIOD_STATISTICS_FILE)
 
     @classmethod
     def directories(cls) -> None:
@@ -144,27 +186,32 @@ class InitializeSteps:
             try_create(prices_func, f"File {settings['prices_output_file']!r} cannot be created.")
 
     @classmethod
-    def start_date_from_file(cls) -> None:
-        def dates_of(io):
-            line = io.readline()  # Skip first line (head)
-            while line != "":
-                line = io.readline()
-                if not line:
-                    break
-                split = line.split(global_settings.CSV_SEP)
-                try:
-                    yield date_strptime(split[0], settings["date_format"]), split[1]
-                except ValueError:
-                    continue
+    def storage(cls) -> None:
+        # Copy the prices file into the storage (a new storage is created from it by open_storage)
+        if settings["migrate"] and global_settings.PRICES_STORAGE != "csv":
+            existed = os.path.exists(storage_path(settings["prices_output_file"]))
+            storage = open_storage(settings["prices_output_file"], settings["date_format"])
+            if existed:
+                import_csv(storage, settings["prices_output_file"])
+            storage.close()
+
+    @classmethod
+    def journal(cls) -> None:
+        # Remove half-written days and find the days to scrap again
+        journal = ScrapJournal(settings["journal_file"])
+        storage = open_storage(settings["prices_output_file"], settings["date_format"])
+        journal.recover(storage)
+        storage.close()
+        settings["retry_dates"] = journal.unfinished()
+        if len(settings["retry_dates"]) > 0:
+            log(LogLevels.INFO, f"{len(settings['retry_dates'])} unfinished day(s) will be scrapped again")
 
+    @classmethod
+    def start_date_from_file(cls) -> None:
         if "-s" not in argv:  # Argument has not been specified and the file exists: take the newest from the file
-            with open(settings["prices_output_file"], "r") as f:
-                max_date = None
-                for current_date, _country in dates_of(f):
-                    if max_date is None:
-                        max_date = current_date
-                    if current_date > max_date:
-                        max_date = current_date
+            storage = open_storage(settings["prices_output_file"], settings["date_format"])
+            max_date = Watermark(settings["prices_output_file"]).max_date(storage)
+            storage.close()
             if max_date is None:
                 log(LogLevels.WARNING,
                     f"Output file ({settings['prices_output_file']}) is empty: cannot determine the start date. "
@@ -194,16 +241,32 @@ class InitializeSteps:
         )
 
 
-def initialize(args: list) -> Dict[str, Any]:
+def initialize(args: list, read_only: bool = False) -> Dict[str, Any]:
+    """
+    :param read_only: For the commands that only read the prices (query): the prices are not migrated, the journal is
+        not recovered (the prices file is not truncated) and the start date is not taken from the prices
+    """
     global argv, settings
     argv, settings = args, global_settings.DEFAULT_SETTINGS.copy()
 
     InitializeSteps.logging_and_dates()  # Create a basic config of logging
     InitializeSteps.settings()  # Set variables with arguments
     InitializeSteps.directories()  # Set result folder
-    InitializeSteps.start_date_from_file()  # Set start date with the last date in the result file
+    if read_only:
+        settings["retry_dates"] = []
+    else:
+        InitializeSteps.storage()  # Migrate the prices file to the storage
+        InitializeSteps.journal()  # Recover from an interrupted scrapping
+        InitializeSteps.start_date_from_file()  # Set start date with the last date in the result file
     InitializeSteps.driver_path()  # Set the driver path depending on the platform
 
+    unknown = [name for name in global_settings.EXTRA_STATISTICS if quantile_of(name) is None]
+    exit_if(len(unknown) > 0, LogLevels.ERROR,
+            f"Unknown extra statistic(s) in settings.py: {', '.join(unknown)}. "
+            f"Use \"median\" or \"pNN\" (e.g. \"p10\").")
+    exit_if(settings["summary_format"] not in global_settings.SUMMARY_FORMATS, LogLevels.ERROR,
+            f"Unknown summary format {settings['summary_format']!r}. "
+            f"Use {', '.join(map(repr, global_settings.SUMMARY_FORMATS))}.")
     exit_if(len(settings["countries"]) == 0, LogLevels.ERROR,
             "No country specified. Please specify one with the command line arguments (see help for more info).")
 
@@ -214,12 +277,15 @@ def initialize(args: list) -> Dict[str, Any]:
     log(LogLevels.INFO, f"\x1b[0m\x1b[3mCountries: \x1b[0m\x1b[33m{', '.join(settings['countries'])}")
     log(LogLevels.INFO, f"\x1b[0m\x1b[3mPrices result file: \x1b[0m\x1b[33m{settings['prices_output_file']}")
     log(LogLevels.INFO, f"\x1b[0m\x1b[3mAverage result file: \x1b[0m\x1b[33m{settings['average_output_file']}")
+    log(LogLevels.INFO, f"\x1b[0m\x1b[3mScrapping jobs: \x1b[0m\x1b[33m{settings['jobs']}")
     log(LogLevels.INFO, f"\x1b[0m\x1b[3mExit if error: \x1b[0m\x1b[33m{'yes' if settings['exit_if_error'] else 'no'}")
     log(LogLevels.INFO, f"\x1b[0m\x1b[3mScrap website: \x1b[0m\x1b[33m{'yes' if not settings['no_scrap'] else 'no'}")
+    log(LogLevels.INFO, f"\x1b[0m\x1b[3mFrom snapshots: \x1b[0m\x1b[33m{'yes' if settings['from_cache'] else 'no'}")
     log(LogLevels.INFO, f"\x1b[0m\x1b[3mCalculate average: \x1b[0m\x1b[33m"
                         f"{'yes' if not settings['no_average'] else 'no'}")
     log(LogLevels.INFO, f"\x1b[0m\x1b[3mSummarize: \x1b[0m\x1b[33m{'yes' if not settings['no_summary'] else 'no'}")
-    log(LogLevels.INFO, f"\x1b[0m\x1b[3mDriver: \x1b[0m\x1b[33m{settings['driver_path']}")
+    log(LogLevels.INFO, f"\x1b[0m\x1b[3mDriver: \x1b[0m\x1b[33m"
+                        f"{global_settings.WEBDRIVER_URL or settings['driver_path']}")
 
     settings.pop("output_folder")
     return settings
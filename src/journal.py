@@ -0,0 +1,83 @@
+import datetime as dt
+import os
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from ssphlib.log import log, LogLevels
+
+from src.storage import PricesStorage
+import settings as global_settings
+
+PENDING, FETCHED, WRITTEN, FAILED = "pending", "fetched", "written", "failed"
+
+
+class ScrapJournal:
+    """
+    Write-ahead journal of the scrapping, next to the prices file. One line per change of state of a day:
+    "date;state" or "date;fetched;offset" where offset is the size of the prices storage before the rows of the day
+    """
+    __slots__ = ["path", "states", "offsets"]
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.states: Dict[dt.date, str] = {}
+        self.offsets: Dict[dt.date, int] = {}
+        self.load()
+
+    def load(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r") as f:
+            for line in f:
+                split = line.strip().split(global_settings.CSV_SEP)
+                if len(split) < 2:  # Last line cut by a crash
+                    continue
+                try:
+                    date = dt.datetime.strptime(split[0], global_settings.WEBSITE_DATE_FORMAT).date()
+                except ValueError:
+                    continue
+                self.states[date] = split[1]
+                if split[1] == FETCHED and len(split) > 2:
+                    self.offsets[date] = int(split[2])
+
+    def recover(self, storage: PricesStorage) -> None:
+        """
+        Remove from the prices storage the rows of the days not fully written, then compact the journal
+        """
+        cut = [self.offsets[date] for date, state in self.states.items() if state == FETCHED and date in self.offsets]
+        if len(cut) > 0 and storage.size() > min(cut):
+            log(LogLevels.WARNING, f"Removing the rows of the days not fully written from {storage.path!r}")
+            storage.truncate(min(cut))
+        self.offsets.clear()
+
+        # One line per day
+        with open(self.path + ".tmp", "w") as f:
+            for date, state in sorted(self.states.items()):
+                f.write(self.line(date, state))
+        os.replace(self.path + ".tmp", self.path)
+
+    def unfinished(self) -> List[dt.date]:
+        """
+        :return: The days to scrap again: failed days first, then days not written
+        """
+        failed = sorted(date for date, state in self.states.items() if state == FAILED)
+        others = sorted(date for date, state in self.states.items() if state not in (FAILED, WRITTEN))
+        return [*failed, *others]
+
+    def last_written(self) -> Optional[dt.date]:
+        return max((date for date, state in self.states.items() if state == WRITTEN), default=None)
+
+    @staticmethod
+    def line(date: dt.date, state: str, offset: Optional[int] = None) -> str:
+        values: Tuple[str, ...] = (dt.date.strftime(date, global_settings.WEBSITE_DATE_FORMAT), state)
+        if offset is not None:
+            values = (*values, str(offset))
+        return global_settings.CSV_SEP.join(values) + "\n"
+
+    def mark(self, dates: Iterable[dt.date], state: str, offset: Optional[int] = None, sync: bool = False) -> None:
+        with open(self.path, "a") as f:
+            for date in dates:
+                self.states[date] = state
+                f.write(self.line(date, state, offset))
+            if sync:
+                f.flush()
+                os.fsync(f.fileno())
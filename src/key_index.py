@@ -0,0 +1,118 @@
+import os
+from pickle import dump, load, UnpicklingError
+from typing import Dict, List, Set, Tuple
+
+from ssphlib.log import log, LogLevels
+
+from src.storage import PricesStorage, Row
+import settings as global_settings
+
+# (date, country, period) as written in the prices file
+Key = Tuple[str, str, str]
+
+KEY_INDEX_VERSION = 2
+
+
+def same_price(first: str, second: str) -> bool:
+    try:
+        return float(first) == float(second)
+    except ValueError:
+        return first == second
+
+
+class KeyIndex:
+    """
+    Values of the prices by (date, country, period), kept in a sidecar file (prices file name + extension).
+    Used to write each row only once: existing rows are skipped and revised rows are replaced.
+    Not needed by the storages that upsert: everything is done by the storage
+    """
+    __slots__ = ["storage", "path", "values", "days", "duplicates", "revised"]
+
+    def __init__(self, storage: PricesStorage, prices_file: str) -> None:
+        self.storage = storage
+        self.path = prices_file + global_settings.KEY_INDEX_EXTENSION
+        self.values: Dict[Key, str] = {}
+        self.days: Set[Tuple[str, str]] = set()  # (date, country) with at least one row
+        self.duplicates = 0
+        self.revised = 0
+        self.load()
+
+    def load(self) -> None:
+        if self.storage.upserts:
+            return
+        start = 0
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "rb") as f:
+                    version, kind, indexed_size, values = load(f)
+            except (OSError, EOFError, ValueError, UnpicklingError):
+                version, kind, indexed_size, values = None, None, 0, {}
+            # Rows are only appended: the index is still valid up to its size
+            if version == KEY_INDEX_VERSION and kind == self.storage.kind and self.storage.is_boundary(indexed_size):
+                self.values, start = values, indexed_size
+        self.days = {(date, country) for date, country, _ in self.values}
+        self.scan(start)
+
+    def scan(self, start: int) -> None:
+        for date, country, period, value in self.storage.read(start):
+            key = (date, country, period)
+            if key in self.values:
+                self.duplicates += 1
+            self.values[key] = value
+            self.days.add((date, country))
+        if self.duplicates > 0:
+            log(LogLevels.WARNING, f"{self.duplicates} duplicated row(s) in {self.storage.path!r}. "
+                                   f"They will be removed at the end of the scrapping")
+
+    def complete(self, date: str, countries: Set[str]) -> bool:
+        if self.storage.upserts:
+            return self.storage.complete(date, countries)
+        return all((date, country) in self.days for country in countries)
+
+    def upsert(self, rows: List[Row]) -> List[Row]:
+        """
+        :param rows: Rows as given by get_result
+        :return: The new rows to append. Revised rows are replaced by rewrite()
+        """
+        if self.storage.upserts:
+            return rows
+        new_rows = []
+        for row in rows:
+            key = row[:3]
+            value = self.values.get(key)
+            if value is None:
+                new_rows.append(row)
+                self.days.add((row[0], row[1]))
+            elif not same_price(value, row[3]):
+                self.revised += 1
+            else:
+                continue
+            self.values[key] = row[3]
+        return new_rows
+
+    def rewrite(self) -> None:
+        """
+        Write the revised values and remove the duplicated rows, if any
+        """
+        if self.revised == 0 and self.duplicates == 0:
+            return
+        log(LogLevels.INFO, f"Rewriting {self.storage.path!r}: {self.revised} revised row(s), "
+                            f"{self.duplicates} duplicated row(s)")
+
+        def rows():
+            written: Set[Key] = set()
+            for date, country, period, _ in self.storage.read():
+                key = (date, country, period)
+                if key not in written:
+                    written.add(key)
+                    yield (*key, self.values[key])
+
+        self.storage.replace(list(rows()))
+        self.revised = self.duplicates = 0
+
+    def save(self) -> None:
+        if self.storage.upserts:
+            return
+        with open(self.path + ".tmp", "wb") as f:
+            dump((KEY_INDEX_VERSION, self.storage.kind, self.storage.size(), self.values), f)
+        os.replace(self.path + ".tmp", self.path)
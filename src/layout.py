@@ -0,0 +1,47 @@
+import json
+import os
+import threading
+from typing import List
+
+from ssphlib.log import log, LogLevels
+
+from src import xpaths
+
+
+class LayoutResolver:
+    """
+    Xpaths of the table to try, the last one found first. Known xpaths are xpaths.TABLE, xpaths.TABLE_BIS and the
+    ones discovered by the header of the table. Saved between runs
+    """
+    __slots__ = ["path", "xpaths", "lock"]
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.xpaths: List[str] = []
+        self.lock = threading.Lock()
+        if os.path.exists(path):
+            try:
+                with open(path, "r") as f:
+                    self.xpaths = [str(xpath) for xpath in json.load(f)["xpaths"]]
+            except (ValueError, KeyError, TypeError):
+                log(LogLevels.WARNING, f"Layout file {path!r} is invalid. Ignoring")
+        for xpath in (xpaths.TABLE, xpaths.TABLE_BIS):
+            if xpath not in self.xpaths:
+                self.xpaths.append(xpath)
+
+    def candidates(self) -> List[str]:
+        with self.lock:
+            return list(self.xpaths)
+
+    def found(self, xpath: str) -> None:
+        with self.lock:
+            if len(self.xpaths) > 0 and self.xpaths[0] == xpath:
+                return
+            if xpath not in self.xpaths:
+                log(LogLevels.INFO, f"New layout of the table: {xpath}")
+            else:
+                self.xpaths.remove(xpath)
+            self.xpaths.insert(0, xpath)
+            with open(self.path + ".tmp", "w") as f:
+                json.dump({"xpaths": self.xpaths}, f, indent=2)
+            os.replace(self.path + ".tmp", self.path)
@@ -0,0 +1,103 @@
+import datetime as dt
+import mmap
+import os
+from array import array
+from pickle import dump, load, UnpicklingError
+from typing import Dict, Iterator, Tuple
+
+from src.storage import CsvStorage, DateCache, Row, csv_rows
+import settings as global_settings
+
+OFFSET_INDEX_VERSION = 1
+# Bytes of the end of the indexed file kept to check that it was only appended since
+TAIL_CHECK_SIZE = 64
+
+
+class OffsetIndex:
+    """
+    Byte ranges of the rows of each country and day in the prices CSV file, kept in a sidecar file (prices file name +
+    extension): one array of day ordinals, of starts and of ends per country, in the order of the file. Rows are only
+    appended: the rows after the indexed size are added when the index is loaded
+    """
+    __slots__ = ["storage", "path", "size", "tail", "ranges", "changed"]
+
+    def __init__(self, storage: CsvStorage, prices_file: str) -> None:
+        self.storage = storage
+        self.path = prices_file + global_settings.OFFSET_INDEX_EXTENSION
+        self.size = 0
+        self.tail = b""
+        self.ranges: Dict[str, Tuple[array, array, array]] = {}
+        self.changed = False
+        self.load()
+
+    def load(self) -> None:
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "rb") as f:
+                    version, size, tail, ranges = load(f)
+            except (OSError, EOFError, ValueError, TypeError, UnpicklingError):
+                version, size, tail, ranges = None, 0, b"", {}
+            if version == OFFSET_INDEX_VERSION and self.storage.is_boundary(size) and self.ends_with(size, tail):
+                self.size, self.tail, self.ranges = size, tail, ranges
+        if self.size < self.storage.size():
+            self.scan()
+
+    def ends_with(self, size: int, tail: bytes) -> bool:
+        with open(self.storage.path, "rb") as f:
+            f.seek(size - len(tail))
+            return f.read(len(tail)) == tail
+
+    def scan(self) -> None:
+        """
+        Add the rows after the indexed size
+        """
+        sep = global_settings.CSV_SEP.encode("utf-8")
+        dates = DateCache(self.storage.date_format)
+        size = self.storage.size()
+        with open(self.storage.path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as file_map:
+            # Rows are "\n" + row: the end of a row is the start of the next one
+            newline = file_map.find(b"\n") if self.size == 0 else self.size
+            while 0 <= newline < size:
+                start = newline + 1
+                newline = file_map.find(b"\n", start)
+                end = size if newline < 0 else newline
+                fields = file_map[start:end].split(sep, 2)
+                if len(fields) == 3 and dates[fields[0]] is not None:
+                    self.add(fields[1].decode("utf-8"), dates[fields[0]].toordinal(), start, end)
+            self.tail = file_map[max(0, size - TAIL_CHECK_SIZE):size]
+        self.size = size
+        self.changed = True
+
+    def add(self, country: str, ordinal: int, start: int, end: int) -> None:
+        if country not in self.ranges:
+            self.ranges[country] = (array("i"), array("q"), array("q"))
+        ordinals, starts, ends = self.ranges[country]
+        # Rows of a day follow each other: one range
+        if len(ordinals) > 0 and ordinals[-1] == ordinal and ends[-1] + 1 == start:
+            ends[-1] = end
+        else:
+            ordinals.append(ordinal)
+            starts.append(start)
+            ends.append(end)
+
+    def select(self, country: str, start: dt.date, end: dt.date) -> Iterator[Row]:
+        """
+        :return: The rows of the country from `start` to `end` (included), by date, read from their offsets
+        """
+        if country not in self.ranges:
+            return
+        ordinals, starts, ends = self.ranges[country]
+        first, last = start.toordinal(), end.toordinal()
+        found = sorted((ordinal, index) for index, ordinal in enumerate(ordinals) if first <= ordinal <= last)
+        with open(self.storage.path, "rb") as f:
+            for _, index in found:
+                f.seek(starts[index])
+                yield from csv_rows(f.read(ends[index] - starts[index]).decode("utf-8").split("\n"))
+
+    def save(self) -> None:
+        if not self.changed:
+            return
+        with open(self.path + ".tmp", "wb") as f:
+            dump((OFFSET_INDEX_VERSION, self.size, self.tail, self.ranges), f)
+        os.replace(self.path + ".tmp", self.path)
+        self.changed = False
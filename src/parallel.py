@@ -0,0 +1,98 @@
+import datetime as dt
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from typing import Dict, List, Set, Tuple
+
+from src.extra_statistics import merge_periods, PeriodStatistics, record_periods
+from src.storage import CsvStorage, DateCache, PricesStorage
+
+# (country, day)
+DayKey = Tuple[str, dt.date]
+
+
+def range_sums(path: str, date_format: str, countries: Set[str], start: int, end: int) \
+        -> Dict[str, Dict[dt.date, float]]:
+    return CsvStorage(path, date_format).daily_sums(countries, start, end)
+
+
+def range_values(path: str, date_format: str, keys: Set[DayKey], start: int, end: int) -> Dict[DayKey, List[float]]:
+    """
+    :return: The prices of the days `keys` between the bytes `start` and `end`, in the order of the file
+    """
+    dates = DateCache(date_format)
+    values: Dict[DayKey, List[float]] = {}
+    for date, country, _, value in CsvStorage(path, date_format).lines(start, end):
+        key = (country.decode("utf-8"), dates[date])
+        if key in keys:
+            values.setdefault(key, []).append(float(value))
+    return values
+
+
+def range_periods(path: str, date_format: str, countries: Set[str], month_date_format: str, start: int, end: int) \
+        -> PeriodStatistics:
+    return record_periods(CsvStorage(path, date_format).records(countries, start, end),
+                          lambda day: day.strftime(month_date_format))
+
+
+def daily_sums(storage: PricesStorage, countries: Set[str], jobs: int = 1) -> Dict[str, Dict[dt.date, float]]:
+    """
+    Same as storage.daily_sums(). The prices CSV file is split between `jobs` processes by ranges of days. The sums of
+    each range are merged in the order of the file: the days found in several ranges (retried or duplicated days) get
+    the prices of the next ranges one by one, so the sums are the same as the sums of a single process
+    """
+    if jobs <= 1 or not isinstance(storage, CsvStorage):
+        return storage.daily_sums(countries)
+    bounds = storage.day_bounds(jobs)
+    ranges = list(zip(bounds, bounds[1:]))
+    if len(ranges) <= 1:
+        return storage.daily_sums(countries)
+
+    path, date_format = storage.path, storage.date_format
+    with ProcessPoolExecutor(max_workers=len(ranges)) as executor:
+        parts = list(executor.map(range_sums, repeat(path), repeat(date_format), repeat(countries), *zip(*ranges)))
+
+        # Days already found in a previous range
+        first_range: Dict[DayKey, int] = {}
+        split: Dict[int, Set[DayKey]] = {}
+        for index, part in enumerate(parts):
+            for country, days in part.items():
+                for day in days:
+                    if first_range.setdefault((country, day), index) != index:
+                        split.setdefault(index, set()).add((country, day))
+        indexes = sorted(split)
+        values = dict(zip(indexes, executor.map(range_values, repeat(path), repeat(date_format),
+                                                [split[index] for index in indexes],
+                                                [ranges[index][0] for index in indexes],
+                                                [ranges[index][1] for index in indexes])))
+
+    data_day: Dict[str, Dict[dt.date, float]] = {}
+    for index, part in enumerate(parts):
+        for country, days in part.items():
+            sums = data_day.setdefault(country, {})
+            for day, total in days.items():
+                if day not in sums:
+                    sums[day] = total
+                    continue
+                for value in values[index][(country, day)]:
+                    sums[day] += value
+    return data_day
+
+
+def period_statistics(storage: PricesStorage, countries: Set[str], month_date_format: str,
+                      jobs: int = 1) -> PeriodStatistics:
+    """
+    Statistics of the prices of each period of each month. The prices CSV file is split between `jobs` processes by
+    ranges of days: the statistics of the ranges are merged in the order of the file
+    """
+    bounds = storage.day_bounds(jobs) if jobs > 1 and isinstance(storage, CsvStorage) else []
+    ranges = list(zip(bounds, bounds[1:]))
+    if len(ranges) <= 1:
+        return record_periods(storage.records(countries), lambda day: day.strftime(month_date_format))
+
+    with ProcessPoolExecutor(max_workers=len(ranges)) as executor:
+        parts = list(executor.map(range_periods, repeat(storage.path), repeat(storage.date_format), repeat(countries),
+                                  repeat(month_date_format), *zip(*ranges)))
+    merged: PeriodStatistics = {}
+    for part in parts:
+        merge_periods(merged, part)
+    return merged
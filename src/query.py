@@ -0,0 +1,54 @@
+import datetime as dt
+import json
+import os
+import sys
+from typing import Any, Dict, Iterator
+
+from src.offset_index import OffsetIndex
+from src.storage import open_storage, Row
+import settings as global_settings
+
+
+def select(settings: Dict[str, Any], start: dt.date, end: dt.date) -> Iterator[Row]:
+    storage = open_storage(settings["prices_output_file"], settings["date_format"])
+    try:
+        if storage.kind == "csv":  # Rows read from their offsets in the prices file
+            index = OffsetIndex(storage, settings["prices_output_file"])
+            index.save()
+            selector = index.select
+        else:
+            selector = storage.select
+        for country in sorted(settings["countries"]):
+            yield from selector(country, start, end)
+    finally:
+        storage.close()
+
+
+def write_rows(rows: Iterator[Row], as_json: bool) -> None:
+    if not as_json:
+        sys.stdout.write(global_settings.PRICES_CSV_HEAD)
+        for row in rows:
+            sys.stdout.write("\n" + global_settings.CSV_SEP.join(row))
+        sys.stdout.write("\n")
+        return
+
+    sys.stdout.write("[")
+    for index, (date, country, period, value) in enumerate(rows):
+        sys.stdout.write(("," if index > 0 else "") + "\n  " + json.dumps(
+            {"date": date, "country": country, "period": period, "price": float(value)}))
+    sys.stdout.write("\n]\n")
+
+
+def query(settings: Dict[str, Any], start: dt.date, end: dt.date) -> None:
+    """
+    Write the prices of the countries from `start` to `end` (included) to the standard output, as CSV or JSON
+    """
+    rows = select(settings, start, end)
+    try:
+        write_rows(rows, settings["json"])
+        sys.stdout.flush()
+    except BrokenPipeError:
+        # The reader stopped reading (e.g. head): the rest is dropped, also at the exit of python
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+    finally:
+        rows.close()
@@ -0,0 +1,47 @@
+import os
+from pickle import dump, load, HIGHEST_PROTOCOL, UnpicklingError
+from typing import Dict, List, Optional, Tuple
+
+RESULT_VERSION = 1
+
+
+class CalculationResult:
+    """
+    Mean, min and max of each month and price of each day of the current month, for each country. Returned by
+    calculate() and given to summary(). Saved to the cache file by each calculation, for the summaries of the runs
+    without calculation
+    """
+    __slots__ = ["averages", "current_month"]
+
+    def __init__(self, averages: Dict[str, Dict[str, Tuple[float, float, float]]],
+                 current_month: Dict[str, Dict[str, str]]) -> None:
+        self.averages = averages
+        self.current_month = current_month
+
+    def countries(self) -> List[str]:
+        return list(self.averages)
+
+    def months(self, country: str) -> Dict[str, Tuple[float, float, float]]:
+        return self.averages.get(country, {})
+
+    def days(self, country: str) -> Dict[str, str]:
+        return self.current_month.get(country, {})
+
+    def save(self, path: str) -> None:
+        with open(path + ".tmp", "wb") as f:
+            dump((RESULT_VERSION, self.averages, self.current_month), f, protocol=HIGHEST_PROTOCOL)
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def load(cls, path: str) -> Optional["CalculationResult"]:
+        """
+        :return: The saved result, None if it is missing, unreadable or saved by another version
+        """
+        try:
+            with open(path, "rb") as f:
+                version, averages, current_month = load(f)
+        except (OSError, EOFError, ValueError, TypeError, UnpicklingError):
+            return None
+        if version != RESULT_VERSION:
+            return None
+        return cls(averages, current_month)
@@ -1,18 +1,57 @@
-import sys
+from __future__ import annotations
+
 import datetime as dt
+import http.client
+import json
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from queue import Empty, Queue
 from time import sleep, time
-from typing import Any, Dict, List, Optional, Set
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple, Union
+from urllib.parse import urlsplit
 
-from selenium import webdriver, common
-from selenium.webdriver.common.by import By
+try:
+    from selenium import webdriver, common
+    from selenium.webdriver.common.by import By
+    from src.drivers import DriverFactory
+except ImportError:  # Only the "http" fetcher can be used
+    webdriver = common = By = DriverFactory = None
 from ssphlib.log import log, LogLevels
 from ssphlib.utilities import decompose
 
 from src import xpaths
+from src.journal import ScrapJournal, PENDING, WRITTEN, FAILED
+from src.key_index import KeyIndex
+from src.layout import LayoutResolver
+from src.offset_index import OffsetIndex
+from src.snapshots import SnapshotStore, table_from_page
+from src.storage import open_storage, PricesStorage, Row
+from src.watermark import Watermark
+from src.writer import PricesWriter
 import settings as global_settings
 
-do_exit: bool = False
-err_count: int = 0
+# Head of the table and values of each country (in the order of the head)
+Table = Tuple[List[str], Dict[str, List[str]]]
+
+
+class ScrapState:
+    """
+    Errors and exit request of one scrapping worker. Merged at the end of the scrapping
+    """
+    __slots__ = ["do_exit", "page_failed", "err_count", "latencies"]
+
+    def __init__(self) -> None:
+        self.do_exit: bool = False
+        self.page_failed: bool = False  # The table of the current page could not be fetched
+        self.err_count: int = 0
+        self.latencies: List[float] = []  # Time took by each page (seconds)
+
+    def merge(self, other: ScrapState) -> None:
+        self.do_exit = self.do_exit or other.do_exit
+        self.err_count += other.err_count
+        self.latencies.extend(other.latencies)
 
 
 def try_find(wd: webdriver, path: str) -> Optional[str]:
@@ -45,129 +84,480 @@ def try_find_one(wd: webdriver, path: str) -> Optional[List[str]]:
                 sleep(global_settings.WAIT_TRIES)
 
 
-def get_table_xpath(wd: webdriver) -> str:
-    if try_find(wd, xpaths.TABLE) is not None:
-        return xpaths.TABLE
-    elif try_find(wd, xpaths.TABLE_BIS) is not None:
-        return xpaths.TABLE_BIS
-    else:
-        return ""
+def wait_table_xpath(wd: webdriver, candidates: List[str]) -> str:
+    if global_settings.WAIT == "observer":
+        # Returns as soon as one of the tables is rendered
+        try:
+            return wd.execute_async_script(xpaths.WAIT_TABLE_SCRIPT, candidates, global_settings.TIMEOUT_TIME * 1000)
+        except common.exceptions.WebDriverException as exc:
+            log(LogLevels.DEBUG, f"Wait script failed ({type(exc).__name__}), polling")
+
+    for table_xpath in candidates:
+        if try_find(wd, table_xpath) is not None:
+            return table_xpath
+    return ""
+
+
+def get_table_xpath(wd: webdriver, layout: LayoutResolver) -> str:
+    # Known layouts first (the last one found first), then look for the table by its header
+    table_xpath = wait_table_xpath(wd, layout.candidates())
+    if table_xpath == "":
+        try:
+            table_xpath = wd.execute_script(xpaths.DISCOVER_TABLE_SCRIPT, global_settings.TABLE_HEADER_REGEX) or ""
+        except common.exceptions.WebDriverException as exc:
+            log(LogLevels.DEBUG, f"Discover script failed ({type(exc).__name__})")
+    if table_xpath != "":
+        layout.found(table_xpath)
+    return table_xpath
+
+
+def get_table_script(wd: webdriver, table_xpath: str) -> Optional[Table]:
+    # Whole table in a single WebDriver round trip
+    try:
+        table = wd.execute_script(xpaths.TABLE_SCRIPT, table_xpath)
+    except common.exceptions.WebDriverException as exc:
+        log(LogLevels.DEBUG, f"Table script failed ({type(exc).__name__}), using xpaths")
+        return None
+    if not table or not table["head"] or not table["rows"]:
+        return None
+    return table["head"], {row[0]: row[1:] for row in table["rows"] if len(row) > 0}
+
+
+def get_table_xpaths(wd: webdriver, table_xpath: str, countries: Set[str]) -> Table:
+    # One round trip per cell, only for the wanted countries
+    head = try_find_one(wd, xpaths.head_columns(table_xpath)) or []
+    all_countries = try_find_one(wd, xpaths.countries(table_xpath)) or []
+
+    rows: Dict[str, List[str]] = {}
+    for country in countries:
+        if country not in all_countries:
+            continue
+        line = 1 + all_countries.index(country)
+        rows[country] = [wd.find_element(by=By.XPATH, value=xpaths.value(table_xpath).format(line=line, column=column))
+                         .text for column in range(2, len(head) + 2)]
+    return head, rows
+
+
+def parse_api_table(payload: Any) -> Optional[Table]:
+    # Records of the API are flat: one record per country and product
+    records = payload
+    try:
+        for key in global_settings.API_RECORDS_PATH:
+            records = records[key]
+        prices: Dict[str, Dict[str, str]] = {}
+        head: List[str] = []
+        for record in records:
+            product = str(record[global_settings.API_PRODUCT_KEY])
+            price = record[global_settings.API_PRICE_KEY]
+            if product not in head:
+                head.append(product)
+            if isinstance(price, float) and price.is_integer():
+                price = int(price)
+            # Same format as the website ("1234,5"), see get_result
+            prices.setdefault(str(record[global_settings.API_COUNTRY_KEY]), {})[product] = \
+                str(price).replace(".", ",")
+    except (KeyError, TypeError) as exc:
+        log(LogLevels.ERROR, f"Unexpected API response ({type(exc).__name__}: {str(exc)})")
+        return None
+    # A product missing for a country is an empty cell, left out of the rows (see get_result)
+    return head, {country: [values.get(name, "") for name in head] for country, values in prices.items()}
+
+
+def parse_http_page(body: Union[bytes, str]) -> Optional[Table]:
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        log(LogLevels.ERROR, "Response is not JSON")
+        return None
+    return parse_api_table(payload)
+
+
+class Fetcher(ABC):
+    """
+    Gets the table of the tenders for a day. One fetcher is used by one worker only
+    """
+    __slots__ = []
+
+    @abstractmethod
+    def open(self) -> bool:
+        """
+        Prepare the fetcher (driver, connection...)
+        :return: Whether the fetcher can be used
+        """
+        pass
+
+    @abstractmethod
+    def fetch(self, current_date: dt.date, countries: Set[str]) -> Optional[Table]:
+        """
+        Get the table of a day
+        :param current_date: The day to fetch
+        :param countries: Countries wanted (other countries may be returned)
+        :return: The table, or None if it cannot be found
+        """
+        pass
+
+    @abstractmethod
+    def close(self) -> None:
+        pass
+
+
+class SeleniumFetcher(Fetcher):
+    """
+    Reads the table rendered by the website in Firefox
+    """
+    __slots__ = ["url", "drivers", "layout", "store", "wd"]
+
+    def __init__(self, url: str, drivers: DriverFactory, layout: LayoutResolver,
+                 store: Optional[SnapshotStore] = None) -> None:
+        self.url = url
+        self.drivers = drivers
+        self.layout = layout
+        self.store = store
+        self.wd: Optional[webdriver.Firefox] = None
+
+    def open(self) -> bool:
+        self.wd = self.drivers.acquire()
+        if self.wd is not None:
+            self.wd.set_script_timeout(global_settings.TIMEOUT_TIME + 1)
+        return self.wd is not None
+
+    def fetch(self, current_date: dt.date, countries: Set[str]) -> Optional[Table]:
+        self.wd.get(self.url.format(date=dt.date.strftime(current_date, global_settings.WEBSITE_DATE_FORMAT)))
+
+        table_xpath = get_table_xpath(self.wd, self.layout)
+        if table_xpath == "":
+            return None
+        if self.store is not None:
+            self.store.save(self.url, current_date, "selenium", self.wd.page_source)
+        table = None
+        if global_settings.EXTRACTION == "script":
+            table = get_table_script(self.wd, table_xpath)
+        if table is None:
+            table = get_table_xpaths(self.wd, table_xpath, countries)
+        return table
+
+    def close(self) -> None:
+        if self.wd is not None:
+            self.drivers.release(self.wd)
+            self.wd = None
+
+
+class HttpFetcher(Fetcher):
+    """
+    Reads the JSON the website gets from its backend. Keeps the connection alive between days
+    """
+    __slots__ = ["url", "store", "connection"]
+
+    def __init__(self, url: str, store: Optional[SnapshotStore] = None) -> None:
+        self.url = url
+        self.store = store
+        self.connection: Optional[http.client.HTTPConnection] = None
+
+    def connect(self) -> None:
+        split = urlsplit(self.url)
+        connection_class = http.client.HTTPSConnection if split.scheme == "https" else http.client.HTTPConnection
+        self.connection = connection_class(split.netloc, timeout=global_settings.TIMEOUT_TIME * 5)
+
+    def open(self) -> bool:
+        self.connect()
+        return True
+
+    def request(self, target: str) -> Tuple[int, bytes]:
+        self.connection.request("GET", target, headers={"Accept": "application/json", "Connection": "keep-alive"})
+        response = self.connection.getresponse()
+        return response.status, response.read()
+
+    def fetch(self, current_date: dt.date, countries: Set[str]) -> Optional[Table]:
+        split = urlsplit(self.url.format(date=dt.date.strftime(current_date, global_settings.WEBSITE_DATE_FORMAT)))
+        target = split.path + ("?" + split.query if split.query else "")
+        try:
+            status, body = self.request(target)
+        except (http.client.HTTPException, OSError):
+            # The server may have closed the kept-alive connection: retry once with a new one
+            self.connection.close()
+            self.connect()
+            try:
+                status, body = self.request(target)
+            except (http.client.HTTPException, OSError) as exc:
+                log(LogLevels.ERROR, f"Request failed ({type(exc).__name__}: {str(exc)})")
+                return None
+        if status != 200:
+            log(LogLevels.ERROR, f"Request failed with status {status}")
+            return None
+        if self.store is not None:
+            self.store.save(self.url, current_date, "http", body.decode("utf-8"))
+        return parse_http_page(body)
+
+    def close(self) -> None:
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+class CacheFetcher(Fetcher):
+    """
+    Extracts the table from the snapshots saved by the other fetchers. No network
+    """
+    __slots__ = ["url", "store", "layout"]
+
+    def __init__(self, url: str, store: SnapshotStore, layout: LayoutResolver) -> None:
+        self.url = url
+        self.store = store
+        self.layout = layout
+
+    def open(self) -> bool:
+        return True
+
+    def fetch(self, current_date: dt.date, countries: Set[str]) -> Optional[Table]:
+        snapshot = self.store.load(self.url, current_date)
+        if snapshot is None:
+            print("\r", end="", file=global_settings.steps_file)
+            log(LogLevels.WARNING, f"No snapshot for "
+                                   f"{dt.date.strftime(current_date, global_settings.WEBSITE_DATE_FORMAT)}")
+            return None
+        kind, page = snapshot
+        return parse_http_page(page) if kind == "http" else table_from_page(page, self.layout.candidates())
+
+    def close(self) -> None:
+        pass
+
+
+def new_fetcher(
+        drivers: Optional[DriverFactory],
+        layout: LayoutResolver,
+        store: Optional[SnapshotStore],
+        from_cache: bool,
+) -> Fetcher:
+    url = global_settings.API_URL if global_settings.FETCHER == "http" else global_settings.URL
+    if from_cache:
+        return CacheFetcher(url, store, layout)
+    if global_settings.FETCHER == "http":
+        return HttpFetcher(url, store)
+    return SeleniumFetcher(url, drivers, layout, store)
 
 
 def get_data(
-        wd: webdriver.Firefox,
+        fetcher: Fetcher,
         countries: Set[str],
         current_date: dt.date,
         date_format: str,
         exit_if_error: bool,
+        state: ScrapState,
 ) -> Dict[str, Dict[str, str]]:
-    global do_exit, err_count
-
-    table_xpath = get_table_xpath(wd)
-    head = try_find_one(wd, xpaths.head_columns(table_xpath))
-    all_countries = try_find_one(wd, xpaths.countries(table_xpath))
+    table = fetcher.fetch(current_date, countries)
+    state.page_failed = table is None
+    head, rows = table or ([], {})
 
     result: Dict[str, Dict[str, str]] = {}
     for country in countries:
-        if country not in all_countries:
-            print("\r", end="")
+        if country not in rows:
+            print("\r", end="", file=global_settings.steps_file)
             log(LogLevels.ERROR, f"Country {country!r} not found on the website "
                                  f"date {dt.date.strftime(current_date, date_format)}. "
                                  f"{'Exit' if exit_if_error else 'Skip'}")
-            err_count += 1
+            state.err_count += 1
             if exit_if_error:
-                do_exit = True
+                state.do_exit = True
                 break
             continue
 
-        result[country] = {}
-        line = 1 + all_countries.index(country)
-
-        for column in range(2, len(head) + 2):
-            result[country][head[column - 2]] = wd.find_element(
-                by=By.XPATH, value=xpaths.value(table_xpath).format(line=line, column=column)).text
+        result[country] = dict(zip(head, rows[country]))
 
     return result
 
 
-def get_result(result, current_date, date_format: str) -> str:
-    str_result = ""
+def get_result(result, current_date, date_format: str) -> List[Row]:
+    date = dt.date.strftime(current_date, date_format)
+    rows = []
     for country in result.keys():
         for name in result[country].keys():
-            date = dt.date.strftime(current_date, date_format)
             value = result[country][name].replace(".", "").replace(",", ".")
-            str_result += "\n" + global_settings.CSV_SEP.join((str(date), str(country), str(name), str(value)))
-    return str_result
+            if value == "":  # Empty cell: no price
+                continue
+            rows.append((date, str(country), str(name), str(value)))
+    return rows
 
 
 def scrap_page(
-        url: str,
-        wd: webdriver.Firefox,
+        fetcher: Fetcher,
         current_date: dt.date,
         date_format: str,
         countries: Set[str],
         exit_if_error: bool,
-        output_file: str
-) -> None:
-    global do_exit
-    do_exit = False
+        state: ScrapState,
+) -> List[Row]:
+    state.do_exit = False
 
     print("\r", "\x1b[1m\x1b[3m=> Current date: ", dt.date.strftime(current_date, date_format),
-          "\x1b[0m", end="", sep="")
-    sys.stdout.flush()
-    wd.get(url.format(date=dt.date.strftime(current_date, global_settings.WEBSITE_DATE_FORMAT)))
+          "\x1b[0m", end="", sep="", file=global_settings.steps_file)
+    global_settings.steps_file.flush()
+
+    start_page_time = time()
+    result = get_data(fetcher, countries, current_date, date_format, exit_if_error, state)
+    state.latencies.append(time() - start_page_time)
+    return get_result(result, current_date, date_format)
+
 
-    result = get_data(wd, countries, current_date, date_format, exit_if_error)
-    with open(output_file, "a") as f:
-        f.write(get_result(result, current_date, date_format))
+def latency_histogram(latencies: List[float]) -> List[str]:
+    # One line per bucket of LATENCY_BUCKETS (upper bounds in seconds)
+    bounds = [*global_settings.LATENCY_BUCKETS, float("inf")]
+    counts = [0] * len(bounds)
+    for latency in latencies:
+        counts[next(index for index, bound in enumerate(bounds) if latency <= bound)] += 1
+
+    lines, lower = [], 0.0
+    width = max(counts, default=0)
+    for bound, count in zip(bounds, counts):
+        bar = "#" * round(count / width * 40) if width > 0 else ""
+        label = f"{lower:g}-{bound:g}s" if bound != float("inf") else f"> {lower:g}s"
+        lines.append(f"{label:>12} {count:>6} {bar}")
+        lower = bound
+    return lines
+
+
+def scrap_worker(
+        fetcher_factory: Callable[[], Fetcher],
+        days: Queue[Tuple[int, dt.date]],
+        done: Queue[Optional[Tuple[int, List[Row], bool, bool]]],
+        stop: threading.Event,
+        date_format: str,
+        countries: Set[str],
+        exit_if_error: bool,
+) -> ScrapState:
+    # One fetcher per worker. Each scrapped day is sent back to the writer with its index
+    state = ScrapState()
+    fetcher = fetcher_factory()
+    try:
+        if not fetcher.open():
+            return state
+        while not stop.is_set():
+            try:
+                index, current_date = days.get_nowait()
+            except Empty:
+                break
+            rows = scrap_page(fetcher, current_date, date_format, countries, exit_if_error, state)
+            done.put((index, rows, state.do_exit, state.page_failed))
+            if state.do_exit:
+                stop.set()
+                break
+    finally:
+        fetcher.close()
+        done.put(None)  # This worker is over
+    return state
 
 
 def scrap(
-        url: str,
-        wd: webdriver.Firefox,
-        start_date: dt.date,
-        end_date: dt.date,
+        fetcher_factory: Callable[[], Fetcher],
+        dates: List[dt.date],
         date_format: str,
         countries: Set[str],
         exit_if_error: bool,
-        output_file: str
-) -> None:
+        storage: PricesStorage,
+        journal: ScrapJournal,
+        key_index: KeyIndex,
+        watermark: Watermark,
+        jobs: int = 1,
+) -> ScrapState:
     start_scrap_time = time()
 
-    difference = end_date - start_date
-    for gap in range(difference.days + 1):
-        current_date = start_date + dt.timedelta(gap)
-        scrap_page(url, wd, current_date, date_format, countries, exit_if_error, output_file)
-        if do_exit:
-            break
+    days: Queue[Tuple[int, dt.date]] = Queue()
+    done: Queue[Optional[Tuple[int, List[Row], bool, bool]]] = Queue()
+    stop = threading.Event()
+    for index, current_date in enumerate(dates):
+        days.put((index, current_date))
+    journal.mark(dates, PENDING, sync=True)
+    jobs = max(1, min(jobs, len(dates)))
+
+    # Days are written in order: a day waits in `pending` until every previous day is written
+    state = ScrapState()
+    pending: Dict[int, Tuple[List[Row], bool, bool]] = {}
+    next_index, running = 0, jobs
+    with ThreadPoolExecutor(max_workers=jobs) as executor, PricesWriter(storage, journal, watermark) as writer:
+        futures = [executor.submit(scrap_worker, fetcher_factory, days, done, stop, date_format, countries,
+                                   exit_if_error) for _ in range(jobs)]
+        try:
+            while running > 0:
+                item = done.get()
+                if item is None:
+                    running -= 1
+                    continue
+                index, rows, exited, failed = item
+                pending[index] = (rows, exited, failed)
+                while next_index in pending and not state.do_exit:
+                    rows, exited, failed = pending.pop(next_index)
+                    current_date = dates[next_index]
+                    if failed:  # Scrapped again by the next run
+                        journal.mark((current_date,), FAILED)
+                    else:
+                        writer.write(current_date, key_index.upsert(rows))
+                    next_index += 1
+                    state.do_exit = exited
+        finally:
+            stop.set()
+        for future in futures:
+            state.merge(future.result())
+
+    if next_index < len(dates) and not state.do_exit:
+        print("\r", end="", file=global_settings.steps_file)
+        log(LogLevels.WARNING, f"{len(dates) - next_index} day(s) were not scrapped (first missing: "
+                               f"{dt.date.strftime(dates[next_index], date_format)})")
 
     end_scrap_time = time()
     time_took = round(end_scrap_time - start_scrap_time)
     minutes, seconds = decompose(time_took, (60,))
-    print("\r", " " * 25, "\r", end="")
+    print("\r", " " * 25, "\r", end="", file=global_settings.steps_file)
     log(LogLevels.INFO, f"Scrapping took {minutes} minutes and {seconds} seconds.")
+    if len(state.latencies) > 0:
+        log(LogLevels.INFO, f"Time per page (mean: {sum(state.latencies) / len(state.latencies):.3f}s):\n" +
+            "\n".join(latency_histogram(state.latencies)))
+    return state
+
+
+def finish_storage(storage: PricesStorage, key_index: KeyIndex, watermark: Watermark) -> None:
+    # The rewrite replaces the revised rows and removes the duplicates: the newest dates do not change
+    followed = watermark.valid(storage)
+    key_index.rewrite()
+    key_index.save()
+    if followed:
+        watermark.update(storage, [])
+    if storage.kind == "csv":  # Add the new rows to the offsets of the rows
+        OffsetIndex(storage, storage.path).save()
+    storage.close()
 
 
 def process_website(settings: Dict[str, Any]) -> None:
-    # Initialize web driver
-    wd = None
-    try:
-        # noinspection PyUnresolvedReferences
-        wd = webdriver.Firefox(
-            service=webdriver.firefox.service.Service(settings["driver_path"]),
-            options=webdriver.FirefoxOptions()
-        )
-    except common.exceptions.WebDriverException as exc:
-        log(LogLevels.CRITICAL, "Webdriver can't be initialized. \nIf you don't have Firefox, "
-                                "please install it (https://www.mozilla.org/en-US/firefox/new/).")
-        log(LogLevels.CRITICAL, f"{type(exc).__name__}: {str(exc)}")
-    else:
-        # Scrap the website
-        scrap(global_settings.URL, wd, settings["start_date"], settings["end_date"], settings["date_format"],
-              settings["countries"], settings["exit_if_error"], settings["prices_output_file"])
-        if err_count > 0:
-            print(f"\x1b[1m\x1b[31m\t=> {err_count} error(s) happened\x1b[0m")
-    finally:
-        # Close the driver
-        if wd is not None:
-            wd.close()
+    # Days left unfinished by the previous runs first, then the new ones
+    dates = list(settings["retry_dates"])
+    for gap in range((settings["end_date"] - settings["start_date"]).days + 1):
+        current_date = settings["start_date"] + dt.timedelta(gap)
+        if current_date not in dates:
+            dates.append(current_date)
+
+    # Days already in the prices file for every country are not scrapped again, except with --refresh
+    journal = ScrapJournal(settings["journal_file"])
+    storage = open_storage(settings["prices_output_file"], settings["date_format"])
+    key_index = KeyIndex(storage, settings["prices_output_file"])
+    watermark = Watermark(settings["prices_output_file"])
+    if global_settings.SKIP_COMPLETE_DAYS and not settings["refresh"]:
+        complete = [current_date for current_date in dates if key_index.complete(
+            dt.date.strftime(current_date, settings["date_format"]), settings["countries"])]
+        if len(complete) > 0:
+            log(LogLevels.INFO, f"{len(complete)} day(s) already in the prices file are skipped")
+            journal.mark(complete, WRITTEN)
+            dates = [current_date for current_date in dates if current_date not in complete]
+    if len(dates) == 0:
+        finish_storage(storage, key_index, watermark)
+        return
+
+    # Scrap the website (or the snapshots) with a pool of fetchers
+    store = SnapshotStore(settings["snapshots_folder"]) \
+        if global_settings.SAVE_SNAPSHOTS or settings["from_cache"] else None
+    drivers = DriverFactory(settings["driver_path"], global_settings.WEBDRIVER_URL, settings["sessions_file"]) \
+        if global_settings.FETCHER == "selenium" and not settings["from_cache"] else None
+    layout = LayoutResolver(settings["layout_file"])
+    fetcher_factory = partial(new_fetcher, drivers, layout, store, settings["from_cache"])
+    state = scrap(fetcher_factory, dates, settings["date_format"], settings["countries"],
+                  settings["exit_if_error"], storage, journal, key_index, watermark, settings["jobs"])
+    finish_storage(storage, key_index, watermark)
+    if state.err_count > 0:
+        print(f"\x1b[1m\x1b[31m\t=> {state.err_count} error(s) happened\x1b[0m", file=global_settings.steps_file)
@@ -0,0 +1,186 @@
+import datetime as dt
+import gzip
+import json
+import os
+import re
+from hashlib import sha1
+from html.parser import HTMLParser
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+from ssphlib.log import log, LogLevels
+
+from src import xpaths
+import settings as global_settings
+
+# Elements that never have children (they are not closed in HTML)
+VOID_ELEMENTS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "source", "track", "wbr"}
+
+
+class SnapshotStore:
+    """
+    Raw fetched pages, compressed, one file per URL and date: {folder}/{hash of the URL}/{date}.json.gz
+    """
+    __slots__ = ["folder"]
+
+    def __init__(self, folder: str) -> None:
+        self.folder = folder
+
+    def path(self, url: str, current_date: dt.date) -> str:
+        return os.path.join(self.folder, sha1(url.encode()).hexdigest()[:16],
+                            dt.date.strftime(current_date, global_settings.WEBSITE_DATE_FORMAT) + ".json.gz")
+
+    def save(self, url: str, current_date: dt.date, kind: str, body: str) -> None:
+        path = self.path(url, current_date)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename: a snapshot is complete or absent
+        with gzip.open(path + ".tmp", "wt", encoding="utf-8") as f:
+            json.dump({"url": url, "date": dt.date.strftime(current_date, global_settings.WEBSITE_DATE_FORMAT),
+                       "kind": kind, "body": body}, f)
+        os.replace(path + ".tmp", path)
+
+    def load(self, url: str, current_date: dt.date) -> Optional[Tuple[str, str]]:
+        """
+        :return: The kind of the page ("selenium" or "http") and the page, or None if there is no snapshot
+        """
+        path = self.path(url, current_date)
+        if not os.path.exists(path):
+            return None
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                snapshot = json.load(f)
+        except (OSError, EOFError, ValueError) as exc:
+            log(LogLevels.ERROR, f"Snapshot {path!r} is corrupted ({type(exc).__name__})")
+            return None
+        return snapshot["kind"], snapshot["body"]
+
+
+class Node:
+    """
+    Element of a parsed page. Children are nodes or strings (text)
+    """
+    __slots__ = ["tag", "children"]
+
+    def __init__(self, tag: str) -> None:
+        self.tag = tag
+        self.children: List[Union["Node", str]] = []
+
+    @property
+    def text(self) -> str:
+        # Close to the text of a selenium element: whitespaces collapsed
+        def texts(node: Node) -> Iterator[str]:
+            for child in node.children:
+                if isinstance(child, str):
+                    yield child
+                else:
+                    yield from texts(child)
+
+        return " ".join("".join(texts(self)).split())
+
+
+class PageParser(HTMLParser):
+    def __init__(self) -> None:
+        super().__init__(convert_charrefs=True)
+        self.root = Node("")
+        self.stack = [self.root]
+
+    def handle_starttag(self, tag, attrs):
+        node = Node(tag)
+        self.stack[-1].children.append(node)
+        if tag not in VOID_ELEMENTS:
+            self.stack.append(node)
+
+    def handle_endtag(self, tag):
+        for index in range(len(self.stack) - 1, 0, -1):
+            if self.stack[index].tag == tag:
+                del self.stack[index:]
+                break
+
+    def handle_data(self, data):
+        self.stack[-1].children.append(data)
+
+
+def parse_page(page: str) -> Node:
+    parser = PageParser()
+    parser.feed(page)
+    parser.close()
+    return parser.root
+
+
+def find(root: Node, path: str) -> Optional[Node]:
+    """
+    Find the first element of an absolute xpath made of "tag" and "tag[n]" steps (like in xpaths.py)
+    """
+    steps: List[Tuple[str, Optional[int]]] = []
+    for step in path.strip("/").split("/"):
+        tag, _, index = step.partition("[")
+        steps.append((tag, int(index[:-1]) if index else None))
+
+    def walk(node: Node, depth: int) -> Optional[Node]:
+        if depth == len(steps):
+            return node
+        tag, index = steps[depth]
+        children = [child for child in node.children if isinstance(child, Node) and child.tag == tag]
+        if index is not None:
+            children = children[index - 1:index]
+        for child in children:
+            found = walk(child, depth + 1)
+            if found is not None:
+                return found
+        return None
+
+    return walk(root, 0)
+
+
+def discover(root: Node) -> str:
+    """
+    Like xpaths.DISCOVER_TABLE_SCRIPT: xpath of the first table with a header cell matching TABLE_HEADER_REGEX
+    """
+    pattern = re.compile(global_settings.TABLE_HEADER_REGEX)
+
+    def header_matches(table: Node) -> bool:
+        for head in (child for child in table.children if isinstance(child, Node) and child.tag == "thead"):
+            stack = [head]
+            while len(stack) > 0:
+                node = stack.pop()
+                if node.tag == "th" and pattern.search(node.text):
+                    return True
+                stack.extend(child for child in node.children if isinstance(child, Node))
+        return False
+
+    def walk(node: Node, path: str) -> Optional[str]:
+        elements = [child for child in node.children if isinstance(child, Node)]
+        for child in elements:
+            same_tag = [element for element in elements if element.tag == child.tag]
+            step = f"{child.tag}[{same_tag.index(child) + 1}]" if len(same_tag) > 1 else child.tag
+            if child.tag == "table" and header_matches(child):
+                return path + "/" + step
+            found = walk(child, path + "/" + step)
+            if found is not None:
+                return found
+        return None
+
+    return walk(root, "") or ""
+
+
+def table_from_page(page: str, table_xpaths: Sequence[str] = (xpaths.TABLE, xpaths.TABLE_BIS)) \
+        -> Optional[Tuple[List[str], Dict[str, List[str]]]]:
+    # Same xpaths as the live extraction
+    root = parse_page(page)
+    for table_xpath in (*table_xpaths, discover(root)):
+        if table_xpath == "" or find(root, table_xpath) is None:
+            continue
+
+        def column(path: str) -> List[str]:
+            values, count = [], 1
+            while (node := find(root, path.format(count))) is not None:
+                values.append(node.text)
+                count += 1
+            return values
+
+        head = column(xpaths.head_columns(table_xpath))
+        rows: Dict[str, List[str]] = {}
+        for line, country in enumerate(column(xpaths.countries(table_xpath)), 1):
+            rows[country] = [node.text if (node := find(root, xpaths.value(table_xpath).format(
+                line=line, column=column_index))) is not None else "" for column_index in range(2, len(head) + 2)]
+        return head, rows
+    return None
@@ -0,0 +1,932 @@
+import datetime as dt
+import gzip
+import io
+import json
+import lzma
+import mmap
+import os
+import shutil
+import sqlite3
+from abc import ABC, abstractmethod
+from array import array
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from ssphlib.log import log, LogLevels
+
+import settings as global_settings
+
+# Row of the prices: date, country, period and price, as written in the prices CSV file
+Row = Tuple[str, str, str, str]
+# Row of the prices for the calculations
+Record = Tuple[dt.date, str, str, float]
+
+
+def parse_date(date: str, date_format: str) -> dt.date:
+    return dt.datetime.strptime(date, date_format).date()
+
+
+def format_price(value: float) -> str:
+    text = repr(value)
+    return text[:-2] if text.endswith(".0") else text
+
+
+def newest_dates(rows: Iterable[Row], date_format: str) -> Dict[str, dt.date]:
+    dates: Dict[str, dt.date] = {}
+    parsed: Dict[str, Optional[dt.date]] = {}
+    for date, country, *_ in rows:
+        if date not in parsed:
+            try:
+                parsed[date] = parse_date(date, date_format)
+            except ValueError:
+                parsed[date] = None
+        if parsed[date] is not None and (country not in dates or parsed[date] > dates[country]):
+            dates[country] = parsed[date]
+    return dates
+
+
+class DateCache(dict):
+    """
+    Dates of the prices file by their bytes, each parsed once (ISO dates without strptime). None if malformed
+    """
+    __slots__ = ["date_format"]
+
+    def __init__(self, date_format: str) -> None:
+        super().__init__()
+        self.date_format = date_format
+
+    def __missing__(self, date: bytes) -> Optional[dt.date]:
+        try:
+            self[date] = dt.date.fromisoformat(date.decode()) if self.date_format == "%Y-%m-%d" \
+                else parse_date(date.decode(), self.date_format)
+        except ValueError:
+            self[date] = None
+        return self[date]
+
+
+def csv_rows(lines: Iterable[str]) -> Iterator[Row]:
+    for line in lines:
+        split = line.rstrip("\n").split(global_settings.CSV_SEP)
+        if len(split) == 4:
+            yield split[0], split[1], split[2], split[3]
+
+
+class PricesStorage(ABC):
+    """
+    Where the prices are stored. The size is a position in the storage (bytes, rows...): the journal uses it to remove
+    the rows written after it
+    """
+    __slots__ = ["path", "date_format"]
+
+    kind: str = ""
+    # Whether append() replaces the rows already stored (same date, country and period)
+    upserts: bool = False
+
+    def __init__(self, path: str, date_format: str) -> None:
+        self.path = path
+        self.date_format = date_format
+
+    @abstractmethod
+    def size(self) -> int:
+        pass
+
+    @abstractmethod
+    def append(self, rows: List[Row], sync: bool = False) -> None:
+        pass
+
+    @abstractmethod
+    def truncate(self, size: int) -> None:
+        pass
+
+    @abstractmethod
+    def read(self, start: int = 0) -> Iterator[Row]:
+        """
+        :param start: A size returned by size(): only the rows appended after it are read
+        """
+        pass
+
+    @abstractmethod
+    def replace(self, rows: Iterable[Row]) -> None:
+        """
+        Replace every row of the storage
+        """
+        pass
+
+    def is_boundary(self, size: int) -> bool:
+        """
+        :return: Whether `size` can still be a size of the storage (the storage was only appended since)
+        """
+        return size <= self.size()
+
+    def generation(self) -> int:
+        """
+        :return: Number of times the rows of the storage were replaced (see replaced()). A size of another generation
+            is not a size of the storage, even if is_boundary() accepts it (rows rewritten in place)
+        """
+        try:
+            with open(self.path + global_settings.GENERATION_EXTENSION, "r") as f:
+                return int(f.read())
+        except (OSError, ValueError):
+            return 0
+
+    def replaced(self) -> None:
+        """
+        Called by replace() once every row is replaced
+        """
+        generation_file = self.path + global_settings.GENERATION_EXTENSION
+        generation = self.generation() + 1
+        with open(generation_file + ".tmp", "w") as f:
+            f.write(str(generation))
+        os.replace(generation_file + ".tmp", generation_file)
+
+    def records(self, countries: Set[str]) -> Iterator[Record]:
+        for date, country, period, value in self.read():
+            if country not in countries:
+                continue
+            yield parse_date(date, self.date_format), country, period, float(value)
+
+    def daily_sums(self, countries: Set[str]) -> Dict[str, Dict[dt.date, float]]:
+        """
+        :return: The sum of the prices of each day, for each country
+        """
+        data_day: Dict[str, Dict[dt.date, float]] = {}
+        for date, country, _, value in self.records(countries):
+            data_day.setdefault(country, {})
+            data_day[country].setdefault(date, 0)
+            data_day[country][date] += value
+        return data_day
+
+    def complete(self, date: str, countries: Set[str]) -> bool:
+        """
+        :return: Whether there are rows for every country at this date. The storages that upsert have no key index
+            (see KeyIndex): they answer it from their own index
+        """
+        found = {country for row_date, country, *_ in self.read() if row_date == date and country in countries}
+        return len(found) == len(countries)
+
+    def save_averages(self, averages: Dict[str, Dict[str, Tuple[float, float, float]]]) -> None:
+        """
+        Keep the averages of each month (mean, min, max), for the storages that can query them
+        """
+        pass
+
+    def select(self, country: str, start: dt.date, end: dt.date) -> Iterator[Row]:
+        """
+        :return: The rows of the country from `start` to `end` (included), by date
+        """
+        dates: Dict[str, Optional[dt.date]] = {}
+        rows: List[Tuple[dt.date, Row]] = []
+        for row in self.read():
+            if row[1] != country:
+                continue
+            if row[0] not in dates:
+                try:
+                    dates[row[0]] = parse_date(row[0], self.date_format)
+                except ValueError:
+                    dates[row[0]] = None
+            if dates[row[0]] is not None and start <= dates[row[0]] <= end:
+                rows.append((dates[row[0]], row))
+        rows.sort(key=lambda dated_row: dated_row[0])
+        return (row for _, row in rows)
+
+    def max_dates(self) -> Dict[str, dt.date]:
+        """
+        :return: The newest date of each country
+        """
+        return newest_dates(self.read(), self.date_format)
+
+    def max_date(self) -> Optional[dt.date]:
+        return max(self.max_dates().values(), default=None)
+
+    def close(self) -> None:
+        pass
+
+
+class CsvStorage(PricesStorage):
+    """
+    The prices CSV file (PRICES_CSV_HEAD then "\\n" + row for each row). The size is in bytes
+    """
+    __slots__ = ["file"]
+
+    kind = "csv"
+
+    def __init__(self, path: str, date_format: str) -> None:
+        super().__init__(path, date_format)
+        self.file = None
+
+    def size(self) -> int:
+        return os.path.getsize(self.path)
+
+    def append(self, rows: List[Row], sync: bool = False) -> None:
+        if self.file is None:
+            self.file = open(self.path, "ab")
+        self.file.write("".join("\n" + global_settings.CSV_SEP.join(row) for row in rows).encode("utf-8"))
+        self.file.flush()
+        if sync:
+            os.fsync(self.file.fileno())
+
+    def truncate(self, size: int) -> None:
+        self.close()
+        with open(self.path, "r+b") as f:
+            f.truncate(size)
+
+    def is_boundary(self, size: int) -> bool:
+        # Rows are appended as "\n" + row
+        if size > self.size():
+            return False
+        with open(self.path, "rb") as f:
+            f.seek(size)
+            return f.read(1) in (b"\n", b"")
+
+    def read(self, start: int = 0) -> Iterator[Row]:
+        with open(self.path, "r", encoding="utf-8") as f:
+            f.seek(start)
+            if start == 0:
+                f.readline()  # Skip first line (head)
+            yield from csv_rows(f)
+
+    def mapped_lines(self, file_map: mmap.mmap, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+        """
+        Lines of the file from the byte `start` (0 or the start of a row) to the byte `end` (start of a row, excluded)
+        """
+        file_map.seek(start)
+        if start == 0:
+            file_map.readline()  # Skip first line (head)
+        if end is None:
+            return iter(file_map.readline, b"")
+        return (file_map.readline() for _ in iter(lambda: file_map.tell() < end, False))
+
+    def lines(self, start: int = 0, end: Optional[int] = None) -> Iterator[List[bytes]]:
+        """
+        Rows of the file split in bytes, read from a memory map (without the head and the malformed rows)
+        """
+        if self.size() == 0:
+            return
+        sep = global_settings.CSV_SEP.encode("utf-8")
+        with open(self.path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as file_map:
+            for line in self.mapped_lines(file_map, start, end):
+                split = line.split(sep)
+                if len(split) == 4:
+                    yield split
+
+    def records(self, countries: Set[str], start: int = 0, end: Optional[int] = None) -> Iterator[Record]:
+        """
+        :param start: Only the rows from this byte (see mapped_lines)
+        :param end: Only the rows before this byte
+        """
+        wanted = {country.encode("utf-8"): country for country in countries}
+        dates = DateCache(self.date_format)
+        for date, country, period, value in self.lines(start, end):
+            name = wanted.get(country)
+            if name is not None and dates[date] is not None:
+                yield dates[date], name, period.decode("utf-8"), float(value)
+
+    def daily_sums(self, countries: Set[str], start: int = 0,
+                   end: Optional[int] = None) -> Dict[str, Dict[dt.date, float]]:
+        """
+        :param start: Only the rows from this byte (see mapped_lines)
+        :param end: Only the rows before this byte
+        """
+        # Same as records() without the generators: prices are decoded from the bytes
+        wanted = {country.encode("utf-8"): country for country in countries}
+        dates = DateCache(self.date_format)
+        data_day: Dict[str, Dict[dt.date, float]] = {}
+        if self.size() == 0:
+            return data_day
+        sep = global_settings.CSV_SEP.encode("utf-8")
+        with open(self.path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as file_map:
+            for line in self.mapped_lines(file_map, start, end):
+                split = line.split(sep)
+                if len(split) != 4 or split[1] not in wanted:
+                    continue
+                day = dates[split[0]]
+                if day is None:
+                    continue
+                sums = data_day.setdefault(wanted[split[1]], {})
+                sums[day] = sums.get(day, 0) + float(split[3])
+        return data_day
+
+    def day_bounds(self, parts: int) -> List[int]:
+        """
+        :return: The bytes splitting the file in about `parts` ranges of rows, at the first row of a day
+        """
+        size = self.size()
+        bounds = [0]
+        sep = global_settings.CSV_SEP.encode("utf-8")
+        with open(self.path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as file_map:
+
+            def next_row(position: int) -> int:
+                newline = file_map.find(b"\n", position)
+                return size if newline < 0 else newline + 1
+
+            def row_date(position: int) -> bytes:
+                return file_map[position:next_row(position)].split(sep)[0]
+
+            for part in range(1, parts):
+                position = next_row(max(size * part // parts, bounds[-1]))
+                previous = row_date(file_map.rfind(b"\n", 0, position - 1) + 1)
+                while position < size and row_date(position) == previous:
+                    position = next_row(position)
+                if position >= size:
+                    break
+                if position > bounds[-1]:
+                    bounds.append(position)
+        bounds.append(size)
+        return bounds
+
+    def max_dates(self) -> Dict[str, dt.date]:
+        # Every row is read: older days can be appended after the newer ones (retried days, earlier range with -s)
+        dates = DateCache(self.date_format)
+        newest: Dict[bytes, dt.date] = {}
+        for date, country, *_ in self.lines():
+            day = dates[date]
+            if day is not None and (country not in newest or day > newest[country]):
+                newest[country] = day
+        return {country.decode("utf-8"): day for country, day in newest.items()}
+
+    def replace(self, rows: Iterable[Row]) -> None:
+        self.close()
+        with open(self.path + ".tmp", "w", encoding="utf-8") as f:
+            f.write(global_settings.PRICES_CSV_HEAD)
+            for row in rows:
+                f.write("\n" + global_settings.CSV_SEP.join(row))
+        os.replace(self.path + ".tmp", self.path)
+        self.replaced()
+
+    def close(self) -> None:
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class ColumnarStorage(PricesStorage):
+    """
+    One binary file per column in a folder: dates as day ordinals (int32), countries and periods as indexes of
+    dictionaries (uint16) and prices (float64). Rows are appended to every column. The size is in rows
+    """
+    __slots__ = ["countries", "periods", "rows"]
+
+    kind = "columnar"
+    # Column name, array type code
+    COLUMNS = (("dates", "i"), ("countries", "H"), ("periods", "H"), ("prices", "d"))
+    DICTIONARIES = "dictionaries.json"
+
+    def __init__(self, path: str, date_format: str) -> None:
+        super().__init__(path, date_format)
+        os.makedirs(path, exist_ok=True)
+        self.countries: List[str] = []
+        self.periods: List[str] = []
+        if os.path.exists(self.file(self.DICTIONARIES)):
+            with open(self.file(self.DICTIONARIES), "r") as f:
+                dictionaries = json.load(f)
+            self.countries, self.periods = dictionaries["countries"], dictionaries["periods"]
+
+        # A row is complete when it is in every column. The columns are only truncated if needed: opening the storage
+        # does not change their modification times (see StageFingerprints)
+        sizes = [os.path.getsize(self.file(name)) if os.path.exists(self.file(name)) else 0 for name, _ in self.COLUMNS]
+        self.rows = min(size // array(code).itemsize for size, (_, code) in zip(sizes, self.COLUMNS))
+        if any(size != self.rows * array(code).itemsize for size, (_, code) in zip(sizes, self.COLUMNS)):
+            self.truncate(self.rows)
+
+    def file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def save_dictionaries(self) -> None:
+        with open(self.file(self.DICTIONARIES) + ".tmp", "w") as f:
+            json.dump({"countries": self.countries, "periods": self.periods}, f)
+        os.replace(self.file(self.DICTIONARIES) + ".tmp", self.file(self.DICTIONARIES))
+
+    def size(self) -> int:
+        return self.rows
+
+    def append(self, rows: List[Row], sync: bool = False) -> None:
+        if len(rows) == 0:
+            return
+        codes = {"countries": {name: code for code, name in enumerate(self.countries)},
+                 "periods": {name: code for code, name in enumerate(self.periods)}}
+
+        def encode(dictionary: str, name: str) -> int:
+            if name not in codes[dictionary]:
+                codes[dictionary][name] = len(codes[dictionary])
+                getattr(self, dictionary).append(name)
+            return codes[dictionary][name]
+
+        columns = {name: array(code) for name, code in self.COLUMNS}
+        for date, country, period, value in rows:
+            columns["dates"].append(parse_date(date, self.date_format).toordinal())
+            columns["countries"].append(encode("countries", country))
+            columns["periods"].append(encode("periods", period))
+            columns["prices"].append(float(value))
+        # Dictionaries first: a row never refers to a missing name
+        self.save_dictionaries()
+        for name, column in columns.items():
+            with open(self.file(name), "ab") as f:
+                column.tofile(f)
+                if sync:
+                    f.flush()
+                    os.fsync(f.fileno())
+        self.rows += len(rows)
+
+    def truncate(self, size: int) -> None:
+        for name, code in self.COLUMNS:
+            with open(self.file(name), "ab") as f:
+                f.truncate(size * array(code).itemsize)
+        self.rows = size
+
+    def columns(self, start: int = 0) -> Iterator[Tuple[memoryview, memoryview, memoryview, memoryview]]:
+        """
+        Memory-mapped columns (dates, countries, periods, prices) from the row `start`. Valid during the iteration
+        """
+        if start >= self.rows:
+            return
+        files, maps, views = [], [], []
+        try:
+            for name, code in self.COLUMNS:
+                files.append(open(self.file(name), "rb"))
+                maps.append(mmap.mmap(files[-1].fileno(), 0, access=mmap.ACCESS_READ))
+                views.append(memoryview(maps[-1]))
+                views.append(views[-1].cast(code))
+                views.append(views[-1][start:self.rows])
+            yield tuple(views[2::3])
+        finally:
+            for view in reversed(views):
+                view.release()
+            for file_map in maps:
+                file_map.close()
+            for file in files:
+                file.close()
+
+    def read(self, start: int = 0) -> Iterator[Row]:
+        dates: Dict[int, str] = {}
+        for date_column, country_column, period_column, price_column in self.columns(start):
+            for ordinal, country, period, price in zip(date_column, country_column, period_column, price_column):
+                if ordinal not in dates:
+                    dates[ordinal] = dt.date.fromordinal(ordinal).strftime(self.date_format)
+                yield dates[ordinal], self.countries[country], self.periods[period], format_price(price)
+
+    def records(self, countries: Set[str]) -> Iterator[Record]:
+        wanted = {code for code, name in enumerate(self.countries) if name in countries}
+        dates: Dict[int, dt.date] = {}
+        for date_column, country_column, period_column, price_column in self.columns():
+            for ordinal, country, period, price in zip(date_column, country_column, period_column, price_column):
+                if country not in wanted:
+                    continue
+                if ordinal not in dates:
+                    dates[ordinal] = dt.date.fromordinal(ordinal)
+                yield dates[ordinal], self.countries[country], self.periods[period], price
+
+    def max_date(self) -> Optional[dt.date]:
+        for date_column, *_ in self.columns():
+            return dt.date.fromordinal(max(date_column))
+        return None
+
+    def max_dates(self) -> Dict[str, dt.date]:
+        ordinals: Dict[int, int] = {}
+        for date_column, country_column, *_ in self.columns():
+            for ordinal, country in zip(date_column, country_column):
+                if ordinal > ordinals.get(country, 0):
+                    ordinals[country] = ordinal
+        return {self.countries[country]: dt.date.fromordinal(ordinal) for country, ordinal in ordinals.items()}
+
+    def replace(self, rows: Iterable[Row]) -> None:
+        shutil.rmtree(self.path + ".tmp", ignore_errors=True)
+        temporary = ColumnarStorage(self.path + ".tmp", self.date_format)
+        batch: List[Row] = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= 65536:
+                temporary.append(batch)
+                batch.clear()
+        temporary.append(batch)
+        shutil.rmtree(self.path)
+        os.replace(temporary.path, self.path)
+        self.countries, self.periods, self.rows = temporary.countries, temporary.periods, temporary.rows
+        self.replaced()
+
+
+class SqliteStorage(PricesStorage):
+    """
+    SQLite database (WAL mode) with a table of prices indexed by (country, date) and a table of averages per month.
+    Rows are upserted. The size is the last id of the prices table
+    """
+    __slots__ = ["connection"]
+
+    kind = "sqlite"
+    upserts = True
+
+    def __init__(self, path: str, date_format: str) -> None:
+        super().__init__(path, date_format)
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        with self.connection:
+            self.connection.executescript("""
+                CREATE TABLE IF NOT EXISTS prices (
+                    id INTEGER PRIMARY KEY, date TEXT NOT NULL, country TEXT NOT NULL, period TEXT NOT NULL,
+                    price REAL NOT NULL
+                );
+                CREATE UNIQUE INDEX IF NOT EXISTS prices_key ON prices (date, country, period);
+                CREATE INDEX IF NOT EXISTS prices_country_date ON prices (country, date);
+                CREATE TABLE IF NOT EXISTS averages (
+                    country TEXT NOT NULL, month TEXT NOT NULL, mean REAL NOT NULL, min REAL NOT NULL,
+                    max REAL NOT NULL, PRIMARY KEY (country, month)
+                );
+            """)
+
+    def iso(self, date: str) -> str:
+        return parse_date(date, self.date_format).isoformat()
+
+    def size(self) -> int:
+        return self.connection.execute("SELECT coalesce(max(id), 0) FROM prices").fetchone()[0]
+
+    def append(self, rows: List[Row], sync: bool = False) -> None:
+        self.connection.execute(f"PRAGMA synchronous={'FULL' if sync else 'NORMAL'}")
+        with self.connection:  # One transaction per batch
+            self.connection.executemany(
+                "INSERT INTO prices (date, country, period, price) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (date, country, period) DO UPDATE SET price = excluded.price",
+                ((self.iso(date), country, period, float(value)) for date, country, period, value in rows))
+
+    def truncate(self, size: int) -> None:
+        with self.connection:
+            self.connection.execute("DELETE FROM prices WHERE id > ?", (size,))
+
+    def read(self, start: int = 0) -> Iterator[Row]:
+        dates: Dict[str, str] = {}
+        for date, country, period, price in self.connection.execute(
+                "SELECT date, country, period, price FROM prices WHERE id > ? ORDER BY id", (start,)):
+            if date not in dates:
+                dates[date] = dt.date.fromisoformat(date).strftime(self.date_format)
+            yield dates[date], country, period, format_price(price)
+
+    def replace(self, rows: Iterable[Row]) -> None:
+        with self.connection:
+            self.connection.execute("DELETE FROM prices")
+        self.append(list(rows))
+        self.replaced()
+
+    def records(self, countries: Set[str]) -> Iterator[Record]:
+        dates: Dict[str, dt.date] = {}
+        for date, country, period, price in self.connection.execute(
+                f"SELECT date, country, period, price FROM prices WHERE country IN "
+                f"({', '.join('?' * len(countries))}) ORDER BY id", tuple(countries)):
+            if date not in dates:
+                dates[date] = dt.date.fromisoformat(date)
+            yield dates[date], country, period, price
+
+    def daily_sums(self, countries: Set[str]) -> Dict[str, Dict[dt.date, float]]:
+        data_day: Dict[str, Dict[dt.date, float]] = {}
+        for country, date, total in self.connection.execute(
+                f"SELECT country, date, sum(price) FROM prices WHERE country IN "
+                f"({', '.join('?' * len(countries))}) GROUP BY country, date ORDER BY min(id)", tuple(countries)):
+            data_day.setdefault(country, {})[dt.date.fromisoformat(date)] = total
+        return data_day
+
+    def select(self, country: str, start: dt.date, end: dt.date) -> Iterator[Row]:
+        dates: Dict[str, str] = {}
+        for date, period, price in self.connection.execute(
+                "SELECT date, period, price FROM prices WHERE country = ? AND date BETWEEN ? AND ? ORDER BY date, id",
+                (country, start.isoformat(), end.isoformat())):
+            if date not in dates:
+                dates[date] = dt.date.fromisoformat(date).strftime(self.date_format)
+            yield dates[date], country, period, format_price(price)
+
+    def complete(self, date: str, countries: Set[str]) -> bool:
+        found = self.connection.execute(
+            f"SELECT count(DISTINCT country) FROM prices WHERE date = ? AND country IN "
+            f"({', '.join('?' * len(countries))})", (self.iso(date), *countries)).fetchone()[0]
+        return found == len(countries)
+
+    def save_averages(self, averages: Dict[str, Dict[str, Tuple[float, float, float]]]) -> None:
+        with self.connection:
+            self.connection.executemany(
+                "INSERT INTO averages (country, month, mean, min, max) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (country, month) DO UPDATE SET mean = excluded.mean, min = excluded.min, "
+                "max = excluded.max",
+                ((country, month, *values) for country, months in averages.items() for month, values in months.items()))
+
+    def max_date(self) -> Optional[dt.date]:
+        date = self.connection.execute("SELECT max(date) FROM prices").fetchone()[0]
+        return None if date is None else dt.date.fromisoformat(date)
+
+    def max_dates(self) -> Dict[str, dt.date]:
+        return {country: dt.date.fromisoformat(date) for country, date in
+                self.connection.execute("SELECT country, max(date) FROM prices GROUP BY country")}
+
+    def close(self) -> None:
+        self.connection.close()
+
+
+class PartitionedStorage(PricesStorage):
+    """
+    One CSV file per country and month ({folder}/{country}/{yyyy-mm}.csv, same format as the prices file) and a
+    manifest. The size is the number of batches appended: the manifest keeps the size of the partitions before each of
+    the last batches to remove them. The daily sums of each partition are kept in the manifest until it changes
+    """
+    __slots__ = ["manifest"]
+
+    kind = "partitioned"
+    MANIFEST = "manifest.json"
+    KEPT_BATCHES = 16
+
+    def __init__(self, path: str, date_format: str) -> None:
+        super().__init__(path, date_format)
+        os.makedirs(path, exist_ok=True)
+        self.manifest = {"batches": 0, "undo": {}, "partitions": {}}
+        if os.path.exists(os.path.join(path, self.MANIFEST)):
+            with open(os.path.join(path, self.MANIFEST), "r") as f:
+                self.manifest = json.load(f)
+
+    def save_manifest(self) -> None:
+        manifest_file = os.path.join(self.path, self.MANIFEST)
+        with open(manifest_file + ".tmp", "w") as f:
+            json.dump(self.manifest, f)
+        os.replace(manifest_file + ".tmp", manifest_file)
+
+    def partition(self, date: str, country: str) -> str:
+        return f"{country}/{parse_date(date, self.date_format).strftime('%Y-%m')}"
+
+    def file(self, partition: str) -> str:
+        return os.path.join(self.path, partition + ".csv")
+
+    def partitions(self, countries: Optional[Set[str]] = None) -> List[str]:
+        found = []
+        for country in sorted(os.listdir(self.path)):
+            if not os.path.isdir(os.path.join(self.path, country)) or \
+                    (countries is not None and country not in countries):
+                continue
+            found.extend(f"{country}/{name[:-len('.csv')]}"
+                         for name in sorted(os.listdir(os.path.join(self.path, country))) if name.endswith(".csv"))
+        return found
+
+    def size(self) -> int:
+        return self.manifest["batches"]
+
+    def append(self, rows: List[Row], sync: bool = False) -> None:
+        if len(rows) == 0:
+            return
+        groups: Dict[str, List[Row]] = {}
+        for row in rows:
+            groups.setdefault(self.partition(row[0], row[1]), []).append(row)
+
+        # Size of the partitions before the batch first: the batch can be removed if it is not fully written
+        batch = self.manifest["batches"]
+        self.manifest["undo"][str(batch)] = {partition: os.path.getsize(self.file(partition))
+                                             if os.path.exists(self.file(partition)) else 0 for partition in groups}
+        for old in [key for key in self.manifest["undo"] if int(key) <= batch - self.KEPT_BATCHES]:
+            del self.manifest["undo"][old]
+        self.manifest["batches"] = batch + 1
+        self.save_manifest()
+
+        for partition, partition_rows in groups.items():
+            os.makedirs(os.path.dirname(self.file(partition)), exist_ok=True)
+            with open(self.file(partition), "ab") as f:
+                if f.tell() == 0:
+                    f.write(global_settings.PRICES_CSV_HEAD.encode("utf-8"))
+                f.write("".join("\n" + global_settings.CSV_SEP.join(row) for row in partition_rows).encode("utf-8"))
+                if sync:
+                    f.flush()
+                    os.fsync(f.fileno())
+
+    def truncate(self, size: int) -> None:
+        batches = sorted((int(key) for key in self.manifest["undo"] if int(key) >= size), reverse=True)
+        if size < self.size() and (len(batches) == 0 or batches[-1] != size):
+            log(LogLevels.WARNING, f"Cannot remove the batches after {size} from {self.path!r}: too old")
+            return
+        # Latest batch first: the sizes before the batch `size` are applied last
+        for batch in batches:
+            for partition, partition_size in self.manifest["undo"].pop(str(batch)).items():
+                if partition_size == 0:
+                    if os.path.exists(self.file(partition)):
+                        os.remove(self.file(partition))
+                else:
+                    with open(self.file(partition), "r+b") as f:
+                        f.truncate(partition_size)
+        self.manifest["batches"] = min(size, self.manifest["batches"])
+        self.save_manifest()
+
+    def is_boundary(self, size: int) -> bool:
+        # Rows are not ordered by batch: only the whole storage can be read
+        return size == self.size()
+
+    def read(self, start: int = 0) -> Iterator[Row]:
+        if start >= self.size() and start > 0:
+            return
+        for partition in self.partitions():
+            yield from CsvStorage(self.file(partition), self.date_format).read()
+
+    def replace(self, rows: Iterable[Row]) -> None:
+        shutil.rmtree(self.path + ".tmp", ignore_errors=True)
+        temporary = PartitionedStorage(self.path + ".tmp", self.date_format)
+        batch: List[Row] = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= 65536:
+                temporary.append(batch)
+                batch.clear()
+        temporary.append(batch)
+        temporary.manifest["undo"] = {}
+        temporary.save_manifest()
+        shutil.rmtree(self.path)
+        os.replace(temporary.path, self.path)
+        self.manifest = temporary.manifest
+        self.replaced()
+
+    def records(self, countries: Set[str]) -> Iterator[Record]:
+        for partition in self.partitions(countries):
+            yield from CsvStorage(self.file(partition), self.date_format).records(countries)
+
+    def daily_sums(self, countries: Set[str]) -> Dict[str, Dict[dt.date, float]]:
+        # Only the partitions changed since the last time and the current month are read
+        current_month = global_settings.TODAY.strftime("%Y-%m")
+        cache = self.manifest["partitions"]
+        data_day: Dict[str, Dict[dt.date, float]] = {}
+        changed = False
+        for partition in self.partitions(countries):
+            stat = os.stat(self.file(partition))
+            cached = cache.get(partition)
+            if cached is None or cached["size"] != stat.st_size or cached["mtime"] != stat.st_mtime_ns or \
+                    partition.endswith(current_month):
+                sums = CsvStorage(self.file(partition), self.date_format).daily_sums(countries)
+                cached = {"size": stat.st_size, "mtime": stat.st_mtime_ns,
+                          "sums": {date.isoformat(): total for days in sums.values() for date, total in days.items()}}
+                cache[partition] = cached
+                changed = True
+            country = partition.split("/")[0]
+            data_day.setdefault(country, {}).update(
+                (dt.date.fromisoformat(date), total) for date, total in cached["sums"].items())
+        if changed:
+            self.save_manifest()
+        return data_day
+
+    def select(self, country: str, start: dt.date, end: dt.date) -> Iterator[Row]:
+        # Partitions of the months of the dates only
+        first, last = start.strftime("%Y-%m"), end.strftime("%Y-%m")
+        for partition in self.partitions({country}):
+            if first <= partition.split("/")[1] <= last:
+                yield from CsvStorage(self.file(partition), self.date_format).select(country, start, end)
+
+    def max_dates(self) -> Dict[str, dt.date]:
+        # Newest partition of each country only
+        newest: Dict[str, str] = {}
+        for partition in self.partitions():
+            newest[partition.split("/")[0]] = partition
+        dates: Dict[str, dt.date] = {}
+        for partition in newest.values():
+            dates.update(CsvStorage(self.file(partition), self.date_format).max_dates())
+        return dates
+
+
+class CompressedStorage(PricesStorage):
+    """
+    The prices CSV file compressed, with one compressed member per batch of rows: rows are appended without reading
+    the file and the members are read as one stream. The size is in bytes
+    """
+    __slots__ = []
+
+    MAGIC = b""
+
+    def __init__(self, path: str, date_format: str) -> None:
+        super().__init__(path, date_format)
+        if not os.path.exists(path):
+            open(path, "wb").close()
+
+    @staticmethod
+    @abstractmethod
+    def compress(data: bytes) -> bytes:
+        pass
+
+    @staticmethod
+    @abstractmethod
+    def decompressor(file: BinaryIO) -> BinaryIO:
+        pass
+
+    def size(self) -> int:
+        return os.path.getsize(self.path)
+
+    def member(self, rows: Iterable[Row], head: bool) -> bytes:
+        text = "".join("\n" + global_settings.CSV_SEP.join(row) for row in rows)
+        return self.compress(((global_settings.PRICES_CSV_HEAD if head else "") + text).encode("utf-8"))
+
+    def append(self, rows: List[Row], sync: bool = False) -> None:
+        if len(rows) == 0:
+            return
+        with open(self.path, "ab") as f:
+            f.write(self.member(rows, f.tell() == 0))
+            if sync:
+                f.flush()
+                os.fsync(f.fileno())
+
+    def truncate(self, size: int) -> None:
+        with open(self.path, "r+b") as f:
+            f.truncate(size)
+
+    def is_boundary(self, size: int) -> bool:
+        # A member starts at each size
+        if size >= self.size():
+            return size == self.size()
+        with open(self.path, "rb") as f:
+            f.seek(size)
+            return f.read(len(self.MAGIC)) == self.MAGIC
+
+    def read(self, start: int = 0) -> Iterator[Row]:
+        if start >= self.size():
+            return
+        with open(self.path, "rb") as f:
+            f.seek(start)
+            with io.TextIOWrapper(self.decompressor(f), encoding="utf-8") as lines:
+                if start == 0:
+                    lines.readline()  # Skip first line (head)
+                yield from csv_rows(lines)
+
+    def replace(self, rows: Iterable[Row]) -> None:
+        with open(self.path + ".tmp", "wb") as f:
+            batch: List[Row] = []
+            head = True
+            for row in rows:
+                batch.append(row)
+                if len(batch) >= 65536:
+                    f.write(self.member(batch, head))
+                    batch.clear()
+                    head = False
+            if len(batch) > 0 or head:
+                f.write(self.member(batch, head))
+        os.replace(self.path + ".tmp", self.path)
+        self.replaced()
+
+
+class GzipStorage(CompressedStorage):
+    __slots__ = []
+
+    kind = "gzip"
+    MAGIC = b"\x1f\x8b"
+
+    @staticmethod
+    def compress(data: bytes) -> bytes:
+        return gzip.compress(data, compresslevel=global_settings.COMPRESSION_LEVEL)
+
+    @staticmethod
+    def decompressor(file: BinaryIO) -> BinaryIO:
+        return gzip.GzipFile(fileobj=file, mode="rb")
+
+
+class XzStorage(CompressedStorage):
+    __slots__ = []
+
+    kind = "xz"
+    MAGIC = b"\xfd7zXZ\x00"
+
+    @staticmethod
+    def compress(data: bytes) -> bytes:
+        return lzma.compress(data, format=lzma.FORMAT_XZ, preset=global_settings.COMPRESSION_LEVEL)
+
+    @staticmethod
+    def decompressor(file: BinaryIO) -> BinaryIO:
+        return lzma.LZMAFile(file, mode="rb")
+
+
+def storage_path(prices_file: str) -> str:
+    """
+    :return: The path of the storage chosen by PRICES_STORAGE, next to the prices CSV file
+    """
+    if global_settings.PRICES_STORAGE == "csv":
+        return prices_file
+    if global_settings.PRICES_STORAGE == "sqlite":
+        return os.path.splitext(prices_file)[0] + global_settings.SQLITE_EXTENSION
+    if global_settings.PRICES_STORAGE in ("gzip", "xz"):
+        return prices_file + (global_settings.GZIP_EXTENSION if global_settings.PRICES_STORAGE == "gzip"
+                              else global_settings.XZ_EXTENSION)
+    if global_settings.PRICES_STORAGE == "partitioned":
+        return os.path.splitext(prices_file)[0]
+    return os.path.splitext(prices_file)[0] + global_settings.COLUMNAR_EXTENSION
+
+
+def open_storage(prices_file: str, date_format: str) -> PricesStorage:
+    """
+    Storage of the prices chosen by PRICES_STORAGE. The prices CSV file is imported in a new storage
+    """
+    if global_settings.PRICES_STORAGE == "csv":
+        return CsvStorage(prices_file, date_format)
+
+    path = storage_path(prices_file)
+    created = not os.path.exists(path)
+    if global_settings.PRICES_STORAGE == "sqlite":
+        storage = SqliteStorage(path, date_format)
+    elif global_settings.PRICES_STORAGE in ("gzip", "xz"):
+        storage = GzipStorage(path, date_format) if global_settings.PRICES_STORAGE == "gzip" \
+            else XzStorage(path, date_format)
+    elif global_settings.PRICES_STORAGE == "partitioned":
+        storage = PartitionedStorage(path, date_format)
+    else:
+        storage = ColumnarStorage(path, date_format)
+    if created and os.path.exists(prices_file):
+        import_csv(storage, prices_file)
+    return storage
+
+
+def import_csv(storage: PricesStorage, csv_file: str) -> None:
+    log(LogLevels.INFO, f"Importing {csv_file!r} into {storage.path!r}")
+    storage.replace(CsvStorage(csv_file, storage.date_format).read())
+
+
+def export_csv(storage: PricesStorage, csv_file: str) -> None:
+    log(LogLevels.INFO, f"Exporting {storage.path!r} to {csv_file!r}")
+    CsvStorage(csv_file, storage.date_format).replace(storage.read())
@@ -1,113 +1,138 @@
+import json
 import os
-from pickle import load
-from typing import Any, Dict, List, Literal, Tuple, Union
+import sys
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
 
 from ssphlib.log import log, LogLevels
-from ssphlib.utilities import duplicate, unzip_index
 
 from src.initialize import date_strptime
+from src.result import CalculationResult
 import settings as global_settings
 
 AVERAGE_CSV_HEAD = global_settings.AVERAGE_CSV_HEAD.split(global_settings.CSV_SEP)
 PRICES_CSV_HEAD = global_settings.PRICES_CSV_HEAD.split(global_settings.CSV_SEP)
-
-columns: List[Tuple[str, int]]
-
-
-def print_sep(place: Literal["top", "middle", "bottom"] = "middle"):
-    if place == "top":
-        print("┌", "┬".join(("─" * (n + 2) for n in unzip_index(columns, 1))), "┐", sep="")  # noqa
-    elif place == "middle":
-        print("├", "┼".join(("─" * (n + 2) for n in unzip_index(columns, 1))), "┤", sep="")  # noqa
-    elif place == "bottom":
-        print("└", "┴".join(("─" * (n + 2) for n in unzip_index(columns, 1))), "┘", sep="")  # noqa
-
-
-def print_title():
-    print_line(unzip_index(columns, 0), "left")  # noqa
-    print_sep("middle")
-
-
-def print_line(values: Union[List[str], Any], side: Literal["left", "right"] = "right"):
-    values = [(" " * (columns[i][1] - len(t)) if side == "right" else "") + t +  # noqa
-              (" " * (columns[i][1] - len(t)) if side == "left" else "") for i, t in enumerate(values)]  # noqa
-    print("│ ", " │ ".join(values), " │", sep="")
-
-
-def summary_total(settings: Dict[str, Any], values: Dict[str, Tuple[float, float, float]]):
-    global columns
-
-    # Determinate width of columns
-    max_month = 0
-    max_values = dict(zip(AVERAGE_CSV_HEAD[2:], duplicate(0, 3)))
-    for month, nums in values.items():
-        max_month = max(max_month, len(month))
-        for name, val in zip(AVERAGE_CSV_HEAD[2:], nums):
-            max_values[name] = max(max_values[name], len(str(val)))
-    max_month = max(max_month, len(AVERAGE_CSV_HEAD[1]))
-    max_values = {k: max(v, len(AVERAGE_CSV_HEAD[AVERAGE_CSV_HEAD.index(k)])) for k, v in max_values.items()}
-    columns = [(AVERAGE_CSV_HEAD[1], max_month), *max_values.items()]
-
-    # Print table
-    print_sep("top")
-    print_title()
-    last_year = None
-    for month, (value_mean, value_min, value_max) in values.items():
-        date = date_strptime(month, settings["month_date_format"])
-        if last_year != date.year and last_year is not None:
-            print_sep("middle")
-            print_title()
-        last_year = date.year
-        print_line((month, str(value_mean), str(value_min), str(value_max)))
-    print_sep("bottom")
-
-
-def summary_month(values: Dict[str, str]):
-    global columns
-
-    # Determinate width of columns
-    max_day = 0
-    max_value = 0
-    for month, value in values.items():
-        max_day = max(max_day, len(month))
-        max_value = max(max_value, len(value))
-
-    max_day = max(max_day, len(PRICES_CSV_HEAD[0]))
-    max_value = max(max_value, len(PRICES_CSV_HEAD[3] + " per hour"))
-    columns = [(PRICES_CSV_HEAD[0], max_day), (PRICES_CSV_HEAD[3] + " per hour", max_value)]
-
-    # Print table
-    print_sep("top")
-    print_title()
-    for month, value in values.items():
-        print_line((month, value))
-    print_sep("bottom")
-
-
-def summary(settings: Dict[str, Any]) -> None:
-    if not os.path.exists(global_settings.cache_file):
-        log(LogLevels.ERROR, f"Cannot make a summary: cache file ({global_settings.cache_file}) not found")
-        return
-
-    # Load cache
-    with open(global_settings.cache_file, "rb") as f:
-        raw_data = load(f)
-        data: Dict[str, Dict[str, Tuple[float, float, float]]] = raw_data[0]
-        data_current_month: Dict[str, Dict[str, str]] = raw_data[1]
-    if global_settings.DELETE_CACHE:
-        os.remove(global_settings.cache_file)
-
-    if len(data) == 0:
-        print("Nothing to show")
-    # Print data
-    for (country_data, values_data), (country_month, values_month) in zip(data.items(), data_current_month.items()):
-        assert country_data == country_month
-        country = country_data
-        if country not in settings["countries"]:
-            continue
-        print(f"\t\t\x1b[1m\x1b[4m\x1b[94m{country}\x1b[0m")
-
-        print(f"\t\x1b[1m\x1b[4m\x1b[94mSummary of all the averages per months ({country})\x1b[0m")
-        summary_total(settings, values_data)
-        print(f"\t\x1b[1m\x1b[4m\x1b[94mSummary of the current month ({country})\x1b[0m")
-        summary_month(values_month)
+MONTH_HEAD = AVERAGE_CSV_HEAD[1:]
+DAY_HEAD = [PRICES_CSV_HEAD[0], PRICES_CSV_HEAD[3] + " per hour"]
+
+Rows = List[Tuple[str, ...]]
+
+
+class Table:
+    """
+    Box table of the summary: the widths of the columns and the separators are computed once, from all the rows, and
+    the table is built in one string
+    """
+    __slots__ = ["widths", "top", "middle", "bottom", "title"]
+
+    def __init__(self, head: Sequence[str], rows: Rows) -> None:
+        self.widths = [max([len(name), *(len(row[index]) for row in rows)]) for index, name in enumerate(head)]
+        dashes = ["─" * (width + 2) for width in self.widths]
+        self.top = "┌" + "┬".join(dashes) + "┐"
+        self.middle = "├" + "┼".join(dashes) + "┤"
+        self.bottom = "└" + "┴".join(dashes) + "┘"
+        self.title = "│ " + " │ ".join(name.ljust(width) for name, width in zip(head, self.widths)) + " │"
+
+    def line(self, values: Sequence[str]) -> str:
+        return "│ " + " │ ".join(value.rjust(width) for value, width in zip(values, self.widths)) + " │"
+
+    def render(self, rows: Rows, new_title: Optional[Callable[[int], bool]] = None) -> str:
+        """
+        :param new_title: Whether the title is written again before the row of this index (not the first one)
+        """
+        lines = [self.top, self.title, self.middle]
+        for index, row in enumerate(rows):
+            if index > 0 and new_title is not None and new_title(index):
+                lines += (self.middle, self.title, self.middle)
+            lines.append(self.line(row))
+        lines.append(self.bottom)
+        return "\n".join(lines) + "\n"
+
+
+def month_rows(result: CalculationResult, country: str) -> Rows:
+    return [(month, *map(str, values)) for month, values in result.months(country).items()]
+
+
+def day_rows(result: CalculationResult, country: str) -> Rows:
+    return list(result.days(country).items())
+
+
+def render_table(settings: Dict[str, Any], result: CalculationResult, countries: List[str]) -> str:
+    parts = []
+    for country in countries:
+        months = month_rows(result, country)
+        # The title is written again at each new year
+        years = [date_strptime(month, settings["month_date_format"]).year for month, *_ in months]
+        parts.append(f"\t\t\x1b[1m\x1b[4m\x1b[94m{country}\x1b[0m\n"
+                     f"\t\x1b[1m\x1b[4m\x1b[94mSummary of all the averages per months ({country})\x1b[0m\n")
+        parts.append(Table(MONTH_HEAD, months).render(months, lambda index: years[index] != years[index - 1]))
+        parts.append(f"\t\x1b[1m\x1b[4m\x1b[94mSummary of the current month ({country})\x1b[0m\n")
+        days = day_rows(result, country)
+        parts.append(Table(DAY_HEAD, days).render(days))
+    return "".join(parts)
+
+
+def render_markdown(result: CalculationResult, countries: List[str]) -> str:
+    def table(head: Sequence[str], rows: Rows) -> str:
+        widths = [max([3, len(name), *(len(row[index]) for row in rows)]) for index, name in enumerate(head)]
+        lines = ["| " + " | ".join(name.ljust(width) for name, width in zip(head, widths)) + " |",
+                 "| " + " | ".join("-" * (width - 1) + (":" if index > 0 else "-")
+                                   for index, width in enumerate(widths)) + " |"]
+        lines += ["| " + " | ".join(value.rjust(width) for value, width in zip(row, widths)) + " |" for row in rows]
+        return "\n".join(lines) + "\n"
+
+    parts = []
+    for country in countries:
+        parts.append(f"## {country}\n\n### Summary of all the averages per months\n\n")
+        parts.append(table(MONTH_HEAD, month_rows(result, country)))
+        parts.append("\n### Summary of the current month\n\n")
+        parts.append(table(DAY_HEAD, day_rows(result, country)) + "\n")
+    return "".join(parts)
+
+
+def render_csv(result: CalculationResult, countries: List[str]) -> str:
+    # Two tables separated by an empty line: the averages of the months and the prices of the days of the current month
+    sep = global_settings.CSV_SEP
+    lines = [global_settings.AVERAGE_CSV_HEAD]
+    lines += [sep.join((country, *row)) for country in countries for row in month_rows(result, country)]
+    lines += ["", sep.join((AVERAGE_CSV_HEAD[0], *DAY_HEAD))]
+    lines += [sep.join((country, *row)) for country in countries for row in day_rows(result, country)]
+    return "\n".join(lines) + "\n"
+
+
+def render_json(result: CalculationResult, countries: List[str]) -> str:
+    data = {country: {
+        "months": {month: dict(zip(("mean", "min", "max"), values))
+                   for month, values in result.months(country).items()},
+        "current_month": {day: float(value) for day, value in result.days(country).items()}
+    } for country in countries}
+    return json.dumps(data, indent=2) + "\n"
+
+
+def summary(settings: Dict[str, Any], result: Optional[CalculationResult] = None) -> None:
+    """
+    Show the result of the calculation made by this run or, without calculation, the one saved in the cache file by
+    the last calculation, in the summary format (-o). The output is written with one call
+    """
+    if result is None:
+        result = CalculationResult.load(global_settings.cache_file)
+        if result is None:
+            log(LogLevels.ERROR, f"Cannot make a summary: cache file ({global_settings.cache_file}) not found or "
+                                 f"saved by another version")
+            return
+        if global_settings.DELETE_CACHE:
+            os.remove(global_settings.cache_file)
+
+    countries = [country for country in result.countries() if country in settings["countries"]]
+    summary_format = settings["summary_format"]
+    if summary_format == "json":
+        output = render_json(result, countries)
+    elif summary_format == "csv":
+        output = render_csv(result, countries)
+    elif len(result.averages) == 0:
+        output = "Nothing to show\n"
+    elif summary_format == "markdown":
+        output = render_markdown(result, countries)
+    else:
+        output = render_table(settings, result, countries)
+    sys.stdout.write(output)
+    sys.stdout.flush()
@@ -0,0 +1,102 @@
+import datetime as dt
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # Only the "python" aggregation engine can be used
+    np = None
+
+from src.storage import ColumnarStorage, PricesStorage
+import settings as global_settings
+
+# Aggregates of the closed months and days of the open month, for each country (see MonthlyAggregates)
+Aggregates = Tuple[Dict[str, Dict[str, Optional[List[float]]]], Dict[str, Dict[dt.date, float]]]
+
+
+def load_prices(storage: PricesStorage, countries: Set[str]) -> Tuple["np.ndarray", "np.ndarray", "np.ndarray",
+                                                                        List[str]]:
+    """
+    :return: Country code, day ordinal and price of each row of the countries (in the order of the storage) and the
+        name of each country code
+    """
+    if isinstance(storage, ColumnarStorage):  # Columns copied from the memory map
+        wanted = [code for code, name in enumerate(storage.countries) if name in countries]
+        for date_column, country_column, _, price_column in storage.columns():
+            codes = np.array(country_column, dtype=np.int64)
+            mask = np.isin(codes, wanted)
+            return codes[mask], np.array(date_column, dtype=np.int64)[mask], np.array(price_column)[mask], \
+                list(storage.countries)
+        return np.zeros(0, np.int64), np.zeros(0, np.int64), np.zeros(0), []
+
+    names: Dict[str, int] = {}
+    codes, ordinals, prices = [], [], []
+    for date, country, _, value in storage.records(countries):
+        codes.append(names.setdefault(country, len(names)))
+        ordinals.append(date.toordinal())
+        prices.append(value)
+    return np.array(codes, dtype=np.int64), np.array(ordinals, dtype=np.int64), np.array(prices, dtype=np.float64), \
+        list(names)
+
+
+def groups(keys: "np.ndarray") -> Tuple["np.ndarray", "np.ndarray"]:
+    """
+    :return: Group of each key (groups numbered in the order of their first key) and first index of each group
+    """
+    _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    order = np.argsort(first, kind="stable")
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    return rank[inverse.reshape(-1)], first[order]
+
+
+def monthly_aggregates(storage: PricesStorage, countries: Set[str], month: Callable[[dt.date], str]) -> Aggregates:
+    """
+    Same aggregates as MonthlyAggregates.rebuild with grouped reductions. The totals of the days are made by bincount,
+    one price after the other in the order of the storage, and the sums of the months by sum(), so they are the same as
+    the sums of the python engine
+    """
+    codes, ordinals, prices, names = load_prices(storage, countries)
+    months: Dict[str, Dict[str, Optional[List[float]]]] = {}
+    days: Dict[str, Dict[dt.date, float]] = {}
+    if len(prices) == 0:
+        return months, days
+
+    # Total of each day of each country
+    day_group, first = groups(codes * (int(ordinals.max()) + 1) + ordinals)
+    day_totals = np.bincount(day_group, weights=prices, minlength=len(first))
+    day_codes, day_ordinals = codes[first], ordinals[first]
+
+    # Month of each day (formatted once per date)
+    unique_ordinals, ordinal_index = np.unique(day_ordinals, return_inverse=True)
+    month_names: Dict[str, int] = {}
+    ordinal_months = np.array([month_names.setdefault(month(dt.date.fromordinal(int(ordinal))), len(month_names))
+                               for ordinal in unique_ordinals], dtype=np.int64)
+    day_months = ordinal_months[ordinal_index.reshape(-1)]
+    month_list = list(month_names)
+
+    # Sum, count, min and max of the days of each month of each country
+    values = day_totals / global_settings.PRICE_DIVIDER
+    month_group, month_first = groups(day_codes * len(month_list) + day_months)
+    counts = np.bincount(month_group, minlength=len(month_first))
+    order = np.argsort(month_group, kind="stable")
+    starts = np.searchsorted(month_group[order], np.arange(len(month_first)))
+    minimums = np.minimum.reduceat(values[order], starts)
+    maximums = np.maximum.reduceat(values[order], starts)
+    # Same summation as sum() of the python engine (compensated since python 3.12)
+    month_values = values[order].tolist()
+    sums = [sum(month_values[start:end]) for start, end in zip(starts.tolist(), [*starts.tolist()[1:], len(values)])]
+
+    # The newest month of each country is open: the total of its days is kept
+    newest = np.zeros(len(names), dtype=np.int64)
+    np.maximum.at(newest, day_codes, day_ordinals)
+    open_months = {int(code): month(dt.date.fromordinal(int(newest[code]))) for code in np.unique(day_codes)}
+    for index, first_day in enumerate(month_first):
+        code = int(day_codes[first_day])
+        month_name = month_list[day_months[first_day]]
+        months.setdefault(names[code], {})[month_name] = None if month_name == open_months[code] else \
+            [sums[index], int(counts[index]), float(minimums[index]), float(maximums[index])]
+    for code, ordinal, total, day_month in zip(day_codes.tolist(), day_ordinals.tolist(), day_totals.tolist(),
+                                               day_months.tolist()):
+        if month_list[day_month] == open_months[code]:
+            days.setdefault(names[code], {})[dt.date.fromordinal(ordinal)] = total
+    return months, days
@@ -0,0 +1,65 @@
+import datetime as dt
+import json
+import os
+from typing import Dict, List, Optional
+
+from ssphlib.log import log, LogLevels
+
+from src.storage import PricesStorage, Row, newest_dates
+import settings as global_settings
+
+
+class Watermark:
+    """
+    Newest date of each country in the prices storage, kept in a small file (prices file name + extension) with the
+    kind and the size of the storage. Only valid while the storage has this size: updated by the writer after each
+    batch, computed again from the storage otherwise
+    """
+    __slots__ = ["path", "kind", "size", "dates"]
+
+    def __init__(self, prices_file: str) -> None:
+        self.path = prices_file + global_settings.WATERMARK_EXTENSION
+        self.kind: Optional[str] = None
+        self.size = -1
+        self.dates: Dict[str, dt.date] = {}
+        self.load()
+
+    def load(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r") as f:
+                watermark = json.load(f)
+            self.kind, self.size = watermark["kind"], watermark["size"]
+            self.dates = {country: dt.date.fromisoformat(date) for country, date in watermark["dates"].items()}
+        except (OSError, ValueError, KeyError, TypeError):
+            self.kind, self.size, self.dates = None, -1, {}
+
+    def save(self) -> None:
+        with open(self.path + ".tmp", "w") as f:
+            json.dump({"kind": self.kind, "size": self.size,
+                       "dates": {country: date.isoformat() for country, date in self.dates.items()}}, f)
+        os.replace(self.path + ".tmp", self.path)
+
+    def valid(self, storage: PricesStorage) -> bool:
+        return self.kind == storage.kind and self.size == storage.size()
+
+    def reset(self, storage: PricesStorage) -> None:
+        log(LogLevels.DEBUG, f"Finding the newest dates of {storage.path!r}")
+        self.kind, self.size, self.dates = storage.kind, storage.size(), storage.max_dates()
+        self.save()
+
+    def update(self, storage: PricesStorage, rows: List[Row]) -> None:
+        """
+        Add the rows just appended to the storage
+        """
+        for country, date in newest_dates(rows, storage.date_format).items():
+            if country not in self.dates or date > self.dates[country]:
+                self.dates[country] = date
+        self.kind, self.size = storage.kind, storage.size()
+        self.save()
+
+    def max_date(self, storage: PricesStorage) -> Optional[dt.date]:
+        if not self.valid(storage):
+            self.reset(storage)
+        return max(self.dates.values(), default=None)
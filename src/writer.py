@@ -0,0 +1,58 @@
+import datetime as dt
+from time import time
+from typing import List, Optional
+
+from src.journal import ScrapJournal, FETCHED, WRITTEN
+from src.storage import PricesStorage, Row
+from src.watermark import Watermark
+import settings as global_settings
+
+
+class PricesWriter:
+    """
+    Appends the rows of the scrapped days to the prices storage, by batches. The storage stays open during the
+    scrapping. A batch is written when it has more than WRITE_BATCH_SIZE rows, is older than WRITE_BATCH_TIME or when
+    the writer is closed. The days of a batch are marked as written in the journal once the batch is in the storage
+    (see WRITE_DURABILITY), then the watermark is updated
+    """
+    __slots__ = ["storage", "journal", "watermark", "rows", "dates", "batch_start"]
+
+    def __init__(self, storage: PricesStorage, journal: ScrapJournal, watermark: Optional[Watermark] = None) -> None:
+        self.storage = storage
+        self.journal = journal
+        self.watermark = watermark
+        if watermark is not None and not watermark.valid(storage):
+            watermark.reset(storage)
+        self.rows: List[Row] = []
+        self.dates: List[dt.date] = []
+        self.batch_start = time()
+
+    def write(self, current_date: dt.date, rows: List[Row]) -> None:
+        if len(self.dates) == 0:
+            self.batch_start = time()
+        self.rows.extend(rows)
+        self.dates.append(current_date)
+        if len(self.rows) >= global_settings.WRITE_BATCH_SIZE or \
+                time() - self.batch_start >= global_settings.WRITE_BATCH_TIME:
+            self.flush()
+
+    def flush(self) -> None:
+        if len(self.dates) == 0:
+            return
+        sync = global_settings.WRITE_DURABILITY == "fsync"
+        self.journal.mark(self.dates, FETCHED, self.storage.size(), sync=sync)
+        self.storage.append(self.rows, sync=sync)
+        self.journal.mark(self.dates, WRITTEN, sync=sync)
+        if self.watermark is not None:
+            self.watermark.update(self.storage, self.rows)
+        self.rows.clear()
+        self.dates.clear()
+
+    def close(self) -> None:
+        self.flush()
+
+    def __enter__(self) -> "PricesWriter":
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
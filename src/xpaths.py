@@ -30,3 +30,80 @@ def value(table: str = TABLE):
 @lru_cache
 def countries(table: str = TABLE):
     return value(table).replace("{column}", "1").replace("{line}", "{}")
+
+
+# Script returning the whole table in one round trip: {"head": [names], "rows": [[country, values...]]}
+# arguments[0] is the table xpath
+TABLE_SCRIPT = """
+const table = document.evaluate(arguments[0], document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null)
+    .singleNodeValue;
+if (table === null) {
+    return null;
+}
+const text = (node) => node === null ? "" : node.innerText.trim();
+const head = Array.from(table.querySelectorAll(":scope > thead > tr:nth-of-type(2) > th"))
+    .map((th) => text(th.querySelector(":scope > span > div > span")));
+const rows = Array.from(table.querySelectorAll(":scope > tbody > tr"))
+    .map((tr) => Array.from(tr.querySelectorAll(":scope > td")).map(text));
+return {"head": head, "rows": rows};
+"""
+
+
+# Asynchronous script waiting for one of the tables to have rows, with a mutation observer
+# arguments[0] are the table xpaths, arguments[1] the timeout in milliseconds
+# Returns the xpath of the table found or "" after the timeout
+WAIT_TABLE_SCRIPT = """
+const [paths, timeout, done] = arguments;
+const find = () => {
+    for (const path of paths) {
+        const table = document.evaluate(path, document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null)
+            .singleNodeValue;
+        if (table !== null && table.querySelector(":scope > tbody > tr") !== null) {
+            return path;
+        }
+    }
+    return null;
+};
+const found = find();
+if (found !== null) {
+    done(found);
+    return;
+}
+let timer = null;
+const observer = new MutationObserver(() => {
+    const found = find();
+    if (found !== null) {
+        observer.disconnect();
+        clearTimeout(timer);
+        done(found);
+    }
+});
+observer.observe(document, {childList: true, subtree: true});
+timer = setTimeout(() => {
+    observer.disconnect();
+    done("");
+}, timeout);
+"""
+
+
+# Script looking for the table by the text of its header, when no known xpath matches
+# arguments[0] is a regular expression one of the header cells must match
+# Returns the xpath of the table or ""
+DISCOVER_TABLE_SCRIPT = """
+const pattern = new RegExp(arguments[0]);
+for (const table of document.querySelectorAll("table")) {
+    const cells = Array.from(table.querySelectorAll(":scope > thead th"));
+    if (!cells.some((th) => pattern.test(th.innerText.trim()))) {
+        continue;
+    }
+    const steps = [];
+    for (let node = table; node !== null; node = node.parentElement) {
+        const siblings = node.parentElement === null ? [node] : Array.from(node.parentElement.children)
+            .filter((sibling) => sibling.tagName === node.tagName);
+        const tag = node.tagName.toLowerCase();
+        steps.unshift(siblings.length > 1 ? `${tag}[${siblings.indexOf(node) + 1}]` : tag);
+    }
+    return "/" + steps.join("/");
+}
+return "";
+"""
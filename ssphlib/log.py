@@ -13,7 +13,7 @@ from typing import Callable, TextIO, Tuple, Union
 from .error import SSPHLIBDoesNotExistsError, SSPHLIBInstantiatedError, SSPHLIBWrongArgumentError
 from .utilities import match_letters
 
-__all__ = ["LogLevels", "set_log_format", "log", "exit_error", "exit_if"]
+__all__ = ["LogLevels", "set_log_format", "set_log_file", "log", "exit_error", "exit_if"]
 
 
 _IGNORE_FUNCTIONS = ["exit_error", "exit_if"]
@@ -21,6 +21,7 @@ _DEFAULT_LOG_FORMAT = "\x1b[33m[{date}]\x1b[0m In '\x1b[95m{func}\x1b[0m' from \
                "\n\x1b[3m{color}[{level}]\x1b[0m: \x1b[1m{message}\x1b[0m\n\n"
 
 _log_format = _DEFAULT_LOG_FORMAT
+_log_file: Union[TextIO, None] = None
 
 
 class __LogLevelsMeta(type):
@@ -109,13 +110,24 @@ def set_log_format(new_log_format: str):
         _log_format = str(new_log_format)
 
 
-def log(level: int, message: str, _code=None, *, file: TextIO = sys.stdout, ignore_log_functions: bool = True):
+def set_log_file(new_log_file: Union[TextIO, None]):
+    """
+    Change the default file of the logs. Pass None to bring back the standard output
+    :param new_log_file: the new default file
+    """
+    global _log_file
+    if new_log_file is not None and not hasattr(new_log_file, "write"):
+        raise SSPHLIBWrongArgumentError("File must be writable")
+    _log_file = new_log_file
+
+
+def log(level: int, message: str, _code=None, *, file: Union[TextIO, None] = None, ignore_log_functions: bool = True):
     """
     Log something. Does not print anything if `LogLevels.current is greater than `level`
     :param level: The log level. You should use `LogLevels.XYZ`
     :param message: The message to output. Can be anything
     :param _code: Dummy parameter to make this function compatible with exit_error
-    :param file: The file to print the message. Default to the standard output
+    :param file: The file to print the message. Default to the file given to `set_log_file` or the standard output
     :param ignore_log_functions: In the inspection for the caller function,
     ignore log function like `exit_error` if True
     """
@@ -128,6 +140,8 @@ def log(level: int, message: str, _code=None, *, file: TextIO = sys.stdout, igno
         raise SSPHLIBDoesNotExistsError(f"No such level {level}")
     level_name, _, color = LogLevels.get_with_number(level)
 
+    if file is None:
+        file = sys.stdout if _log_file is None else _log_file
     if not hasattr(file, "write"):
         raise SSPHLIBWrongArgumentError("File must be writable")
 
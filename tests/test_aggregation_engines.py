@@ -0,0 +1,68 @@
+import datetime as dt
+
+import pytest
+
+pytest.importorskip("numpy")
+
+from src.aggregates import MonthlyAggregates  # noqa: E402
+from src.storage import open_storage  # noqa: E402
+import settings as global_settings  # noqa: E402
+
+DATE_FORMAT = "%Y-%m-%d"
+COUNTRIES = {"Frankreich", "Deutschland"}
+
+
+def prices_rows():
+    # Three months of prices, then a retried day of the first month (appended after the newer days) and a retried day
+    # of the open month (already written) whose rows are split in two batches
+    rows = []
+    day = dt.date(2023, 12, 1)
+    while day < dt.date(2024, 2, 10):
+        for country_index, country in enumerate(("Frankreich", "Deutschland", "Schweiz")):
+            for period in range(6):
+                value = round((day.toordinal() % 17) * 1.37 + period * 0.11 + country_index * 3.3, 2)
+                name = f"NEG_{period * 4:02d}_{period * 4 + 4:02d}"
+                rows.append((day.strftime(DATE_FORMAT), country, name, str(value)))
+        day += dt.timedelta(days=1)
+    rows += [("2023-12-31", "Frankreich", f"POS_{period * 4:02d}_{period * 4 + 4:02d}", str(10.5 + period))
+             for period in range(6)]
+    rows += [("2024-02-05", "Deutschland", "NEG_00_04", "7.25"), ("2024-02-05", "Frankreich", "NEG_00_04", "8.5")]
+    rows += [("2024-02-05", "Deutschland", "NEG_04_08", "0.1"), ("2024-02-05", "Deutschland", "NEG_08_12", "0.2")]
+    return rows
+
+
+@pytest.fixture(params=["csv", "columnar"])
+def prices_file(request, tmp_path, monkeypatch):
+    monkeypatch.setattr(global_settings, "PRICES_STORAGE", request.param)
+    monkeypatch.setattr(global_settings, "TODAY", dt.date(2024, 2, 20))
+    path = str(tmp_path / "prices.csv")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(global_settings.PRICES_CSV_HEAD)
+        for row in prices_rows():
+            f.write("\n" + global_settings.CSV_SEP.join(row))
+    return path
+
+
+def aggregate(prices_file, engine, monkeypatch):
+    monkeypatch.setattr(global_settings, "AGGREGATION_ENGINE", engine)
+    storage = open_storage(prices_file, DATE_FORMAT)
+    try:
+        aggregates = MonthlyAggregates(storage, prices_file, COUNTRIES, "%Y-%m")
+        aggregates.update(rebuild=True)
+        return aggregates.months, aggregates.days, aggregates.averages(), aggregates.current_month(DATE_FORMAT)
+    finally:
+        storage.close()
+
+
+def test_numpy_engine_matches_python_engine(prices_file, monkeypatch):
+    months, days, averages, current_month = aggregate(prices_file, "numpy", monkeypatch)
+    expected_months, expected_days, expected_averages, expected_current_month = \
+        aggregate(prices_file, "python", monkeypatch)
+
+    assert months == expected_months
+    assert days == expected_days
+    assert averages == expected_averages
+    assert current_month == expected_current_month
+    assert set(months) == COUNTRIES
+    assert months["Frankreich"]["2024-02"] is None  # Open month
+    assert dt.date(2024, 2, 5) in days["Deutschland"]
@@ -0,0 +1,101 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip("selenium")
+
+from src.drivers import DriverFactory  # noqa: E402
+import settings as global_settings  # noqa: E402
+
+
+class WebDriverHandler(BaseHTTPRequestHandler):
+    """
+    Minimal WebDriver server: creates, reads the URL of and deletes sessions
+    """
+
+    def reply(self, status: int, value) -> None:
+        body = json.dumps({"value": value}).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def invalid_session(self) -> None:
+        self.reply(404, {"error": "invalid session id", "message": "Session is not running", "stacktrace": ""})
+
+    def do_POST(self) -> None:
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.path != "/session":
+            return self.reply(404, {"error": "unknown command", "message": self.path, "stacktrace": ""})
+        session_id = f"session-{len(self.server.created)}"
+        self.server.created.append(session_id)
+        self.server.alive.add(session_id)
+        self.reply(200, {"sessionId": session_id, "capabilities": {"browserName": "firefox"}})
+
+    def do_GET(self) -> None:
+        _, _, session_id, command = self.path.split("/", 3)
+        if session_id not in self.server.alive or command != "url":
+            return self.invalid_session()
+        self.server.checked.append(session_id)
+        self.reply(200, "about:blank")
+
+    def do_DELETE(self) -> None:
+        self.server.alive.discard(self.path.split("/")[2])
+        self.reply(200, None)
+
+    def log_message(self, *_) -> None:
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), WebDriverHandler)
+    server.created, server.checked, server.alive = [], [], set()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def factory(server, tmp_path, monkeypatch):
+    monkeypatch.setattr(global_settings, "KEEP_SESSIONS", True)
+    url = f"http://127.0.0.1:{server.server_port}"
+    sessions_file = str(tmp_path / global_settings.SESSIONS_FILE)
+    return lambda: DriverFactory("", url, sessions_file)
+
+
+def test_session_created_saved_and_reattached(server, factory):
+    first_run = factory()
+    wd = first_run.acquire()
+    assert wd.session_id == "session-0"
+    first_run.release(wd)
+    assert first_run.load_sessions() == ["session-0"]
+
+    # Next run: the saved session is checked and reused, no session is created
+    second_run = factory()
+    wd = second_run.acquire()
+    assert wd.session_id == "session-0"
+    assert server.created == ["session-0"]
+    assert server.checked == ["session-0"]
+    assert second_run.load_sessions() == []  # Taken while in use
+    second_run.release(wd)
+    assert second_run.load_sessions() == ["session-0"]
+
+
+def test_dead_session_dropped(server, factory):
+    first_run = factory()
+    first_run.release(first_run.acquire())
+    server.alive.clear()  # The server was restarted
+
+    second_run = factory()
+    wd = second_run.acquire()
+    assert wd.session_id == "session-1"
+    assert server.created == ["session-0", "session-1"]
+    assert server.checked == []
+    second_run.release(wd)
+    assert second_run.load_sessions() == ["session-1"]
@@ -0,0 +1,75 @@
+import datetime as dt
+
+import pytest
+
+from src.calculate import calculate
+from src.storage import CsvStorage
+import settings as global_settings
+
+DATE_FORMAT = "%Y-%m-%d"
+COUNTRIES = {"Frankreich", "Deutschland"}
+
+
+def prices_rows():
+    rows = []
+    day = dt.date(2024, 1, 1)
+    while day < dt.date(2024, 3, 15):
+        for country in ("Frankreich", "Deutschland", "Schweiz"):
+            rows += [(day.strftime(DATE_FORMAT), country, f"NEG_{period:02d}",
+                      str(round((day.toordinal() * 11 + period * 5) % 89 * 0.53, 2))) for period in range(6)]
+        day += dt.timedelta(days=1)
+    return rows
+
+
+def append_rows(path: str, rows) -> None:
+    with open(path, "a", encoding="utf-8") as f:
+        for row in rows:
+            f.write("\n" + global_settings.CSV_SEP.join(row))
+
+
+@pytest.fixture
+def output(tmp_path, monkeypatch):
+    monkeypatch.setattr(global_settings, "PRICES_STORAGE", "csv")
+    monkeypatch.setattr(global_settings, "AGGREGATION_ENGINE", "python")
+    monkeypatch.setattr(global_settings, "EXTRA_STATISTICS", ("median", "p10", "p90"))
+    monkeypatch.setattr(global_settings, "TODAY", dt.date(2024, 3, 20))
+    monkeypatch.setattr(global_settings, "cache_file", str(tmp_path / "cache.pkl"))
+    return tmp_path
+
+
+def run(folder, rebuild: bool, jobs: int = 1):
+    settings = {"prices_output_file": str(folder / "prices.csv"), "average_output_file": str(folder / "average.csv"),
+                "period_statistics_file": str(folder / "periods.csv"), "date_format": DATE_FORMAT,
+                "month_date_format": "%Y-%m", "countries": COUNTRIES, "rebuild": rebuild, "jobs": jobs,
+                "no_summary": False}
+    calculate(settings)
+    with open(settings["average_output_file"], "rb") as f, open(settings["period_statistics_file"], "rb") as g:
+        return f.read(), g.read()
+
+
+def test_statistics_of_the_new_rows_only(output, monkeypatch):
+    rows = prices_rows()
+    (output / "prices.csv").write_text(global_settings.PRICES_CSV_HEAD, encoding="utf-8")
+    append_rows(str(output / "prices.csv"), rows[:len(rows) // 3])
+    run(output, rebuild=False)
+    append_rows(str(output / "prices.csv"), rows[len(rows) // 3:])
+
+    # The statistics kept by the aggregates get the new rows: the storage is not read again
+    def read_everything(*_):
+        raise AssertionError("Every row read")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(CsvStorage, "records", read_everything)
+        patch.setattr(CsvStorage, "daily_sums", read_everything)
+        incremental = run(output, rebuild=False)
+
+    assert incremental == run(output, rebuild=True)
+    assert incremental[0].startswith(global_settings.AVERAGE_CSV_HEAD.encode("utf-8") + b";Median;P10;P90")
+    assert incremental[1].count(b"\n") == 2 * 3 * 6  # Countries, months, periods
+
+
+def test_statistics_of_the_processes(output):
+    (output / "prices.csv").write_text(global_settings.PRICES_CSV_HEAD, encoding="utf-8")
+    append_rows(str(output / "prices.csv"), prices_rows())
+
+    assert run(output, rebuild=True, jobs=3) == run(output, rebuild=True)
@@ -0,0 +1,94 @@
+import datetime as dt
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from src.scrap import HttpFetcher, get_result
+
+PAYLOAD = os.path.join(os.path.dirname(__file__), "data", "api-tenders-2024-02-01.json")
+DAY = dt.date(2024, 2, 1)
+
+
+class RecordedHandler(BaseHTTPRequestHandler):
+    """
+    Serves the recorded response of the backend, on kept-alive connections unless the server closes them
+    """
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self) -> None:
+        self.server.targets.append(self.path)
+        self.server.connections.add(self.client_address)
+        with open(PAYLOAD, "rb") as f:
+            body = f.read()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        # Closed without "Connection: close", like a server dropping an idle kept-alive connection
+        self.close_connection = self.server.drop_connections
+
+    def log_message(self, *_) -> None:
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), RecordedHandler)
+    server.targets, server.connections, server.drop_connections = [], set(), False
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def fetcher(server) -> HttpFetcher:
+    fetcher = HttpFetcher(f"http://127.0.0.1:{server.server_port}/api/tenders/results?date={{date}}")
+    assert fetcher.open()
+    return fetcher
+
+
+def test_rows_of_the_recorded_response(server):
+    http_fetcher = fetcher(server)
+    try:
+        head, rows = http_fetcher.fetch(DAY, {"Frankreich"})
+    finally:
+        http_fetcher.close()
+
+    assert server.targets == ["/api/tenders/results?date=2024-02-01"]
+    assert head == ["NEG_00_04", "NEG_04_08", "POS_00_04"]
+    assert rows == {"Frankreich": ["5,21", "1234,5", "12"], "Deutschland": ["4,98", "6,1", ""]}
+    # The product missing for Deutschland is not written
+    result = {country: dict(zip(head, values)) for country, values in rows.items()}
+    assert get_result(result, DAY, "%Y-%m-%d") == [
+        ("2024-02-01", "Frankreich", "NEG_00_04", "5.21"), ("2024-02-01", "Frankreich", "NEG_04_08", "1234.5"),
+        ("2024-02-01", "Frankreich", "POS_00_04", "12"), ("2024-02-01", "Deutschland", "NEG_00_04", "4.98"),
+        ("2024-02-01", "Deutschland", "NEG_04_08", "6.1")]
+
+
+def test_connection_kept_alive(server):
+    http_fetcher = fetcher(server)
+    try:
+        tables = [http_fetcher.fetch(DAY + dt.timedelta(days=gap), {"Frankreich"}) for gap in range(3)]
+    finally:
+        http_fetcher.close()
+
+    assert all(table is not None for table in tables)
+    assert len(server.targets) == 3
+    assert len(server.connections) == 1
+
+
+def test_reconnect_when_the_server_closes_the_connection(server):
+    server.drop_connections = True
+    http_fetcher = fetcher(server)
+    try:
+        tables = [http_fetcher.fetch(DAY + dt.timedelta(days=gap), {"Frankreich"}) for gap in range(3)]
+    finally:
+        http_fetcher.close()
+
+    assert all(table is not None for table in tables)
+    assert len(server.targets) == 3
+    assert len(server.connections) == 3
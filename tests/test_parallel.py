@@ -0,0 +1,60 @@
+import datetime as dt
+
+import pytest
+
+from src.calculate import calculate
+from src.parallel import daily_sums
+from src.storage import CsvStorage
+import settings as global_settings
+
+DATE_FORMAT = "%Y-%m-%d"
+COUNTRIES = {"Frankreich", "Deutschland"}
+
+
+def write_prices(path: str) -> None:
+    # Two months of prices, then retried days appended after the newer ones (one of them already written)
+    rows = []
+    day = dt.date(2024, 1, 1)
+    while day < dt.date(2024, 3, 1):
+        if day != dt.date(2024, 1, 10):
+            for country in ("Frankreich", "Deutschland", "Schweiz"):
+                rows += [(day.strftime(DATE_FORMAT), country, f"NEG_{period:02d}",
+                          str(round((day.toordinal() * 7 + period * 13) % 97 * 0.37, 2))) for period in range(6)]
+        day += dt.timedelta(days=1)
+    rows += [("2024-01-10", "Frankreich", f"NEG_{period:02d}", str(1.1 * period)) for period in range(6)]
+    rows += [("2024-02-03", "Deutschland", "NEG_00", "0.1"), ("2024-02-03", "Deutschland", "NEG_01", "0.3")]
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(global_settings.PRICES_CSV_HEAD)
+        for row in rows:
+            f.write("\n" + global_settings.CSV_SEP.join(row))
+
+
+@pytest.fixture
+def prices_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(global_settings, "PRICES_STORAGE", "csv")
+    monkeypatch.setattr(global_settings, "AGGREGATION_ENGINE", "python")
+    monkeypatch.setattr(global_settings, "TODAY", dt.date(2024, 2, 20))
+    monkeypatch.setattr(global_settings, "cache_file", str(tmp_path / "cache.pkl"))
+    path = str(tmp_path / "prices.csv")
+    write_prices(path)
+    return path
+
+
+@pytest.mark.parametrize("jobs", [2, 3, 7])
+def test_daily_sums_of_the_processes(prices_file, jobs):
+    storage = CsvStorage(prices_file, DATE_FORMAT)
+    assert len(storage.day_bounds(jobs)) > 2  # Split in several ranges
+    assert daily_sums(storage, COUNTRIES, jobs) == daily_sums(storage, COUNTRIES)
+
+
+@pytest.mark.parametrize("jobs", [2, 3, 7])
+def test_average_file_of_the_processes(prices_file, tmp_path, jobs):
+    def average_file(name: str, calculate_jobs: int) -> bytes:
+        settings = {"prices_output_file": prices_file, "average_output_file": str(tmp_path / name),
+                    "date_format": DATE_FORMAT, "month_date_format": "%Y-%m", "countries": COUNTRIES,
+                    "rebuild": True, "jobs": calculate_jobs, "no_summary": False, "period_statistics_file": None}
+        calculate(settings)
+        with open(settings["average_output_file"], "rb") as f:
+            return f.read()
+
+    assert average_file(f"average-{jobs}.csv", jobs) == average_file("average-1.csv", 1)